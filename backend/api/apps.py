@@ -1,5 +1,18 @@
 from django.apps import AppConfig
+from django.core.exceptions import ImproperlyConfigured
+
+from foodgram.settings import (CACHE_BACKEND, LOCAL_CACHE_BACKENDS,
+                               WEB_CONCURRENCY)
 
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        import api.signals  # noqa: F401
+
+        if WEB_CONCURRENCY > 1 and CACHE_BACKEND in LOCAL_CACHE_BACKENDS:
+            raise ImproperlyConfigured(
+                f'{CACHE_BACKEND} не разделяется между {WEB_CONCURRENCY} '
+                'воркерами: задайте общий кэш в CACHE_BACKEND и '
+                'CACHE_LOCATION')
@@ -0,0 +1,40 @@
+from bisect import bisect_left
+
+from api.reference import ingredient_reference
+
+
+class IngredientIndex:
+    """Индекс ингредиентов для поиска по началу и вхождению строки."""
+    def __init__(self, ingredients):
+        self.items = sorted(
+            ingredients,
+            key=lambda item: (item['name'].casefold(), item['id'])
+        )
+        self.keys = [item['name'].casefold() for item in self.items]
+
+    def search(self, query, limit=None):
+        query = query.casefold()
+        start = end = bisect_left(self.keys, query)
+        while end < len(self.keys) and self.keys[end].startswith(query):
+            end += 1
+        results = self.items[start:end]
+        if limit is not None and len(results) >= limit:
+            return results[:limit]
+        results += [
+            item for key, item in zip(self.keys, self.items)
+            if query in key and not key.startswith(query)
+        ]
+        return results[:limit]
+
+
+_index = None
+_version = None
+
+
+def get_ingredient_index():
+    global _index, _version
+    snapshot = ingredient_reference.get()
+    if _version != snapshot.version:
+        _index = IngredientIndex(snapshot.data)
+        _version = snapshot.version
+    return _index
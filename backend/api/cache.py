@@ -0,0 +1,85 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from api.metrics import registry
+from foodgram.settings import RECIPE_CACHE_TIMEOUT
+
+CACHE_NAME = 'recipes'
+
+
+def recipe_key(recipe_id, version):
+    return f'recipe:{recipe_id}:{version}'
+
+
+def version_key(recipe_id):
+    return f'recipe_version:{recipe_id}'
+
+
+def get_versions(recipe_ids):
+    """Текущие версии рецептов; отсутствующие создаются."""
+    keys = {recipe_id: version_key(recipe_id) for recipe_id in recipe_ids}
+    stored = cache.get_many(keys.values())
+    versions = {}
+    for recipe_id, key in keys.items():
+        version = stored.get(key)
+        if version is None:
+            version = time.time_ns()
+            if not cache.add(key, version, None):
+                version = cache.get(key)
+        versions[recipe_id] = version
+    return versions
+
+
+def get_recipes(recipes, build):
+    """Публичные представления рецептов; недостающие собирает build.
+
+    Ключ включает версию рецепта, прочитанную до сборки: если рецепт
+    изменился, пока собиралось представление, запись попадёт под
+    устаревшую версию и читаться больше не будет.
+    """
+    start = time.perf_counter()
+    versions = get_versions([recipe.id for recipe in recipes])
+    keys = {recipe_id: recipe_key(recipe_id, version)
+            for recipe_id, version in versions.items()}
+    cached = cache.get_many(keys.values())
+    lookup = time.perf_counter()
+    misses = [recipe for recipe in recipes if keys[recipe.id] not in cached]
+    if misses:
+        built = {keys[recipe_id]: data
+                 for recipe_id, data in build(misses).items()}
+        cache.set_many(built, RECIPE_CACHE_TIMEOUT)
+        cached.update(built)
+        registry.inc('cache_build_seconds_total', CACHE_NAME,
+                     time.perf_counter() - lookup)
+    registry.inc('cache_hits_total', CACHE_NAME, len(keys) - len(misses))
+    registry.inc('cache_misses_total', CACHE_NAME, len(misses))
+    registry.inc('cache_lookup_seconds_total', CACHE_NAME, lookup - start)
+    return {recipe_id: cached[key] for recipe_id, key in keys.items()}
+
+
+def invalidate_recipes(recipe_ids):
+    """Меняет версии рецептов после фиксации транзакции."""
+    keys = [version_key(recipe_id) for recipe_id in recipe_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.set_many(
+            dict.fromkeys(keys, time.time_ns()), None))
+
+
+def get_stats():
+    """Статистика кэша рецептов в текущем процессе."""
+    hits = registry.value('cache_hits_total', CACHE_NAME)
+    misses = registry.value('cache_misses_total', CACHE_NAME)
+    requested = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / requested if requested else None,
+        'avg_lookup_ms': (
+            registry.value('cache_lookup_seconds_total', CACHE_NAME)
+            / requested * 1000 if requested else None),
+        'avg_build_ms': (
+            registry.value('cache_build_seconds_total', CACHE_NAME)
+            / misses * 1000 if misses else None),
+    }
@@ -0,0 +1,66 @@
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+
+from recipes.models import Favorite, ShoppingCart
+
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'in_carts_count',
+}
+
+
+def update_counter(queryset, field, delta):
+    """Атомарно изменяет счётчик, не опуская его ниже нуля."""
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def update_counter_returning(model, pk, field, delta, fields):
+    """Изменяет счётчик объекта и возвращает объект с полями fields.
+
+    В PostgreSQL проверка объекта, счётчик и чтение полей выполняются
+    одним запросом UPDATE … RETURNING, в остальных базах — UPDATE и
+    SELECT. Строка остаётся заблокированной до конца транзакции.
+    Если объекта нет, возвращает None.
+    """
+    connection = connections[model.objects.db]
+    if connection.vendor != 'postgresql':
+        if not update_counter(model.objects.filter(pk=pk), field, delta):
+            return None
+        return model.objects.only(*fields).get(pk=pk)
+    opts = model._meta
+    quote = connection.ops.quote_name
+    column = quote(opts.get_field(field).column)
+    returning = ', '.join(quote(opts.get_field(name).column)
+                          for name in fields)
+    return next(iter(model.objects.raw(
+        f'UPDATE {quote(opts.db_table)} SET {column} = {column} + %s '
+        f'WHERE {quote(opts.pk.column)} = %s RETURNING {returning}',
+        [delta, pk])), None)
+
+
+def bulk_insert(objects, field):
+    """Вставляет объекты и возвращает значения field добавленных строк.
+
+    Строки, которые успел вставить параллельный запрос, не считаются
+    добавленными: при конфликте объекты вставляются по одному.
+    """
+    if not objects:
+        return set()
+    manager = type(objects[0]).objects
+    try:
+        with transaction.atomic():
+            manager.bulk_create(objects)
+        return {getattr(obj, field) for obj in objects}
+    except IntegrityError:
+        pass
+    inserted = set()
+    for obj in objects:
+        try:
+            with transaction.atomic():
+                manager.bulk_create([obj])
+        except IntegrityError:
+            continue
+        inserted.add(getattr(obj, field))
+    return inserted
@@ -0,0 +1,68 @@
+from collections import namedtuple
+
+from recipes.models import RecipeIngredient
+
+
+class RecipeChanges(namedtuple('RecipeChanges', (
+    'tags_added', 'tags_removed',
+    'ingredients_added', 'ingredients_removed', 'ingredients_changed',
+))):
+    """Изменения тегов и ингредиентов рецепта."""
+    __slots__ = ()
+
+    def __bool__(self):
+        return any(self)
+
+    def amount_deltas(self):
+        deltas = {item.ingredient_id: item.amount
+                  for item in self.ingredients_added}
+        deltas.update({item.ingredient_id: -item.amount
+                       for item in self.ingredients_removed})
+        deltas.update({item.ingredient_id: item.amount - old_amount
+                       for item, old_amount in self.ingredients_changed})
+        return deltas
+
+    def apply(self, recipe):
+        if self.tags_removed:
+            recipe.tags.remove(*self.tags_removed)
+        if self.tags_added:
+            recipe.tags.add(*self.tags_added)
+        if self.ingredients_removed:
+            RecipeIngredient.objects.filter(
+                id__in=[item.id for item in self.ingredients_removed]
+            ).delete()
+        if self.ingredients_added:
+            RecipeIngredient.objects.bulk_create(self.ingredients_added)
+        if self.ingredients_changed:
+            RecipeIngredient.objects.bulk_update(
+                [item for item, _ in self.ingredients_changed], ['amount'])
+
+
+def diff_recipe(recipe, tags, ingredients):
+    """Сравнивает теги и ингредиенты рецепта с новыми значениями."""
+    current_tags = set(recipe.tags.values_list('id', flat=True))
+    new_tags = {tag.id for tag in tags}
+    current = {item.ingredient_id: item for item in recipe.recipes.all()}
+    new = {item['id']: item for item in ingredients}
+
+    changed = []
+    for ingredient_id in current.keys() & new.keys():
+        item = current[ingredient_id]
+        old_amount = item.amount
+        item.amount = new[ingredient_id]['amount']
+        if item.amount != old_amount:
+            changed.append((item, old_amount))
+
+    return RecipeChanges(
+        tags_added=sorted(new_tags - current_tags),
+        tags_removed=sorted(current_tags - new_tags),
+        ingredients_added=[
+            RecipeIngredient(recipe=recipe,
+                             ingredient=new[ingredient_id]['ingredient'],
+                             amount=new[ingredient_id]['amount'])
+            for ingredient_id in new.keys() - current.keys()
+        ],
+        ingredients_removed=[current[ingredient_id]
+                             for ingredient_id in current.keys() - new.keys()],
+        ingredients_changed=changed,
+    )
@@ -0,0 +1,72 @@
+import csv
+import json
+from urllib.parse import quote
+
+from django.db.models import F, Sum
+
+from recipes.models import ShoppingCartTotal
+from recipes.units import base_unit, unit_factor
+
+
+class Echo:
+    """Буфер, который возвращает записанную строку вместо хранения."""
+    def write(self, value):
+        return value
+
+
+def shopping_cart_rows(user):
+    """Итоговые количества ингредиентов из списка покупок пользователя.
+
+    Совместимые единицы приводятся к базовой и суммируются в том же
+    запросе.
+    """
+    unit = 'ingredient__measurement_unit'
+    return ShoppingCartTotal.objects.filter(
+        user=user
+    ).values(
+        name=F('ingredient__name'),
+        unit=base_unit(unit),
+    ).annotate(
+        amount=Sum(F('total') * unit_factor(unit))
+    ).values_list(
+        'name',
+        'unit',
+        'amount'
+    ).order_by('name', 'unit').iterator()
+
+
+def export_txt(rows):
+    yield 'Список покупок:\n'
+    for name, unit, total in rows:
+        yield f' {name} - {total}({unit})\n'
+
+
+def export_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'total'))
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def export_json(rows):
+    yield '['
+    separator = ''
+    for name, unit, total in rows:
+        yield separator + json.dumps(
+            {'name': name, 'measurement_unit': unit, 'total': total},
+            ensure_ascii=False)
+        separator = ','
+    yield ']'
+
+
+EXPORTERS = {
+    'txt': export_txt,
+    'csv': export_csv,
+    'json': export_json,
+}
+
+
+def content_disposition(filename, extension):
+    """Заголовок Content-Disposition с именем файла по RFC 5987."""
+    return (f'attachment; filename="shopping_list.{extension}"; '
+            f"filename*=UTF-8''{quote(filename)}.{extension}")
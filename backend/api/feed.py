@@ -0,0 +1,173 @@
+import heapq
+from itertools import islice
+
+from django.core.cache import cache
+from django.db import transaction
+
+from foodgram.settings import (FEED_CACHE_SIZE, FEED_CACHE_TIMEOUT,
+                               FEED_FANOUT_THRESHOLD)
+from recipes.models import Recipe
+from users.models import Subscription, User
+
+INBOX_KEY = 'feed:inbox:{}'
+TIMELINE_KEY = 'feed:author:{}'
+CHUNK_SIZE = 100
+
+
+def inbox_key(user_id):
+    return INBOX_KEY.format(user_id)
+
+
+def timeline_key(author_id):
+    return TIMELINE_KEY.format(author_id)
+
+
+def recent_ids(queryset):
+    """Последние id рецептов и признак того, что других рецептов нет."""
+    ids = list(queryset.order_by('-id').values_list('id', flat=True)
+               [:FEED_CACHE_SIZE])
+    return ids, len(ids) < FEED_CACHE_SIZE
+
+
+def pushes(followers_count):
+    """Раздаёт ли автор с таким числом подписчиков рецепты по лентам."""
+    return followers_count < FEED_FANOUT_THRESHOLD
+
+
+def pushed_recipes(user_id):
+    """Рецепты авторов, раздающих новые рецепты по лентам подписчиков."""
+    return Recipe.objects.filter(
+        author__following__user_id=user_id,
+        author__followers_count__lt=FEED_FANOUT_THRESHOLD,
+    )
+
+
+def source(cached, queryset, before):
+    """Id по убыванию: сначала из кэша, затем из базы, если кэш неполон."""
+    ids, complete = cached
+    last = before
+    for recipe_id in ids:
+        if before is not None and recipe_id >= before:
+            continue
+        yield recipe_id
+        last = recipe_id
+    if complete:
+        return
+    if ids:
+        last = ids[-1] if last is None else min(last, ids[-1])
+    while True:
+        chunk = queryset.order_by('-id')
+        if last is not None:
+            chunk = chunk.filter(id__lt=last)
+        chunk = list(chunk.values_list('id', flat=True)[:CHUNK_SIZE])
+        yield from chunk
+        if len(chunk) < CHUNK_SIZE:
+            return
+        last = chunk[-1]
+
+
+def get_sources(user_id, before):
+    """Входящие пользователя и ленты авторов с большим числом подписчиков."""
+    inbox = cache.get(inbox_key(user_id))
+    if inbox is None:
+        inbox = recent_ids(pushed_recipes(user_id))
+        cache.set(inbox_key(user_id), inbox, FEED_CACHE_TIMEOUT)
+    sources = [source(inbox, pushed_recipes(user_id), before)]
+
+    authors = list(Subscription.objects.filter(
+        user_id=user_id,
+        author__followers_count__gte=FEED_FANOUT_THRESHOLD,
+    ).values_list('author_id', flat=True))
+    keys = {author_id: timeline_key(author_id) for author_id in authors}
+    timelines = cache.get_many(keys.values())
+    missing = {}
+    for author_id, key in keys.items():
+        queryset = Recipe.objects.filter(author_id=author_id)
+        if key not in timelines:
+            timelines[key] = missing[key] = recent_ids(queryset)
+        sources.append(source(timelines[key], queryset, before))
+    if missing:
+        cache.set_many(missing, FEED_CACHE_TIMEOUT)
+    return sources
+
+
+def merged_ids(user_id, before=None):
+    """Слияние источников ленты по убыванию id без повторов."""
+    previous = None
+    for recipe_id in heapq.merge(*get_sources(user_id, before),
+                                 reverse=True):
+        if recipe_id != previous:
+            yield recipe_id
+        previous = recipe_id
+
+
+def feed_page(queryset, user_id, before, limit):
+    """Рецепты ленты с id меньше before и признак следующей страницы.
+
+    Удалённые рецепты могут оставаться в кэше; они пропускаются.
+    """
+    ids = merged_ids(user_id, before)
+    recipes = []
+    while len(recipes) < limit:
+        chunk = list(islice(ids, limit - len(recipes)))
+        if not chunk:
+            return recipes, False
+        found = queryset.in_bulk(chunk)
+        recipes += [found[recipe_id] for recipe_id in chunk
+                    if recipe_id in found]
+    return recipes, next(ids, None) is not None
+
+
+def push(recipe_id, author_id):
+    """Добавляет новый рецепт в закэшированные ленты подписчиков."""
+    cache.delete(timeline_key(author_id))
+    if not Recipe.objects.filter(
+            id=recipe_id,
+            author__followers_count__lt=FEED_FANOUT_THRESHOLD).exists():
+        return
+    keys = [inbox_key(user_id) for user_id in Subscription.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True)]
+    inboxes = cache.get_many(keys)
+    for key, (ids, complete) in inboxes.items():
+        ids = sorted(set(ids) | {recipe_id}, reverse=True)
+        if len(ids) > FEED_CACHE_SIZE:
+            ids, complete = ids[:FEED_CACHE_SIZE], False
+        inboxes[key] = ids, complete
+    cache.set_many(inboxes, FEED_CACHE_TIMEOUT)
+
+
+def recipe_published(recipe_id, author_id):
+    transaction.on_commit(lambda: push(recipe_id, author_id))
+
+
+def recipe_removed(author_id):
+    transaction.on_commit(lambda: cache.delete(timeline_key(author_id)))
+
+
+def subscriptions_changed(user_ids):
+    """Сбрасывает входящие пользователей после изменения подписок."""
+    keys = [inbox_key(user_id) for user_id in user_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def fanout_changed(author_ids):
+    """Сбрасывает входящие подписчиков авторов, сменивших способ раздачи.
+
+    Входящие, собранные до перехода через FEED_FANOUT_THRESHOLD, не
+    содержат рецептов автора, который начал раздавать их по лентам.
+    """
+    subscriptions_changed(set(Subscription.objects.filter(
+        author_id__in=author_ids).values_list('user_id', flat=True)))
+
+
+def followers_changed(author_ids, delta):
+    """Сбрасывает входящие, если счётчик подписчиков перешёл порог.
+
+    Вызывается после изменения followers_count авторов на delta = ±1.
+    """
+    boundary = FEED_FANOUT_THRESHOLD if delta > 0 else (
+        FEED_FANOUT_THRESHOLD - 1)
+    fanout_changed(list(User.objects.filter(
+        id__in=author_ids, followers_count=boundary,
+    ).values_list('id', flat=True)))
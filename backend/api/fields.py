@@ -1,14 +1,66 @@
 import base64
+import binascii
 
 from django.core.files.base import ContentFile
 from rest_framework import serializers
 
+from foodgram.settings import MAX_IMAGE_UPLOAD_SIZE
+
 
 class Base64ImageField(serializers.ImageField):
     """Поле для сериализации изображений в формате base64."""
+    default_error_messages = {
+        'too_large': 'Размер изображения не должен превышать {max_size} байт.',
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
+            try:
+                format, imgstr = data.split(';base64,')
+            except ValueError:
+                self.fail('invalid_image')
+            if len(imgstr) * 3 // 4 > MAX_IMAGE_UPLOAD_SIZE:
+                self.fail('too_large', max_size=MAX_IMAGE_UPLOAD_SIZE)
+            try:
+                content = base64.b64decode(imgstr)
+            except (binascii.Error, ValueError):
+                self.fail('invalid_image')
             ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = ContentFile(content, name='temp.' + ext)
         return super().to_internal_value(data)
+
+
+class ThumbnailImageField(serializers.ImageField):
+    """Поле изображения, отдающее миниатюру, если она уже готова."""
+    def __init__(self, thumbnail, **kwargs):
+        self.thumbnail = thumbnail
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        return getattr(instance, self.thumbnail) or instance.image
+
+
+class ReferencePrimaryKeyField(serializers.PrimaryKeyRelatedField):
+    """Поле первичного ключа с поиском объекта в кэше справочника.
+
+    Объекта, которого ещё нет в копии справочника, ищет в базе.
+    """
+    def __init__(self, reference, **kwargs):
+        self.reference = reference
+        kwargs.setdefault('queryset', reference.model.objects.all())
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        obj = self.reference.get().objects.get(pk)
+        if obj is None:
+            obj = self.get_queryset().filter(pk=pk).first()
+        if obj is None:
+            self.fail('does_not_exist', pk_value=data)
+        return obj
@@ -1,41 +1,67 @@
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
 
-from recipes.models import Recipe, Tag, Ingredient
+from api.reference import tag_reference
+from api.search import search_recipes
+from recipes.models import Favorite, Recipe, ShoppingCart
 
 
-class IngredientFilter(filters.FilterSet):
-    """Фильтр ингридиентов."""
-    name = filters.CharFilter(lookup_expr='startswith')
-
-    class Meta:
-        model = Ingredient
-        fields = ['name']
+def tag_slug_choices():
+    return [(row['slug'], row['slug']) for row in tag_reference.get().data]
 
 
 class RecipeFilter(filters.FilterSet):
     """Фильтр рецептов."""
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_slug_choices,
+        method='filter_tags',
     )
 
     is_favorited = filters.BooleanFilter(method='filter_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_shopping_cart')
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.OrderingFilter(
+        fields=('id', 'favorites_count', 'in_carts_count'),
+    )
 
     class Meta:
         model = Recipe
         fields = ('tags', 'author',)
 
+    def filter_tags(self, queryset, name, value):
+        tag_ids = {row['slug']: row['id']
+                   for row in tag_reference.get().data}
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'),
+            tag_id__in=[tag_ids[slug] for slug in value if slug in tag_ids],
+        )))
+
     def filter_favorited(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(favorites_recipe__user=user)
+            return queryset.filter(Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))))
         return queryset
 
     def filter_shopping_cart(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(shopping_recipe__user=user)
+            return queryset.filter(Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))))
+        return queryset
+
+    def filter_search(self, queryset, name, value):
+        # Поиск применяется в filter_queryset после остальных фильтров.
+        return queryset
+
+    def filter_queryset(self, queryset):
+        """Выборка с поиском: поиску нужны все остальные условия выборки.
+
+        Без PostgreSQL выдача поиска запрашивает из базы только рецепты
+        страницы и поэтому строится последней, уже не как QuerySet.
+        """
+        queryset = super().filter_queryset(queryset)
+        if self.form.cleaned_data.get('search'):
+            return search_recipes(queryset, self.form.cleaned_data['search'])
         return queryset
@@ -0,0 +1,102 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+from sorl.thumbnail import delete, get_thumbnail
+
+from api.cache import invalidate_recipes
+from foodgram.settings import (IMAGE_WORKERS, RECIPE_IMAGE_MAX_SIDE,
+                               RECIPE_THUMBNAIL_DETAIL, RECIPE_THUMBNAIL_LIST)
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+executor = (ThreadPoolExecutor(max_workers=IMAGE_WORKERS,
+                               thread_name_prefix='recipe-image')
+            if IMAGE_WORKERS else None)
+
+
+def resize_image(storage, name):
+    """Пересохраняет изображение с ограничением по большей стороне."""
+    with storage.open(name) as file:
+        image = Image.open(file)
+        image_format = image.format
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((RECIPE_IMAGE_MAX_SIDE, RECIPE_IMAGE_MAX_SIDE))
+        buffer = BytesIO()
+        image.save(buffer, format=image_format, quality=85, optimize=True)
+    directory, filename = os.path.split(name)
+    return storage.save(os.path.join(directory, 'processed', filename),
+                        ContentFile(buffer.getvalue()))
+
+
+def process_recipe_image(recipe_id, name):
+    storage = Recipe._meta.get_field('image').storage
+    processed = resize_image(storage, name)
+    thumbnail_list = get_thumbnail(processed, RECIPE_THUMBNAIL_LIST,
+                                   crop='center', quality=85)
+    thumbnail_detail = get_thumbnail(processed, RECIPE_THUMBNAIL_DETAIL,
+                                     quality=85)
+    updated = Recipe.objects.filter(id=recipe_id, image=name).update(
+        image=processed,
+        thumbnail_list=thumbnail_list.name,
+        thumbnail_detail=thumbnail_detail.name,
+    )
+    if updated:
+        storage.delete(name)
+        invalidate_recipes([recipe_id])
+    else:
+        storage.delete(processed)
+
+
+def run_processing(recipe_id, name):
+    try:
+        process_recipe_image(recipe_id, name)
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', name)
+
+
+def run_in_worker(recipe_id, name):
+    try:
+        run_processing(recipe_id, name)
+    finally:
+        connection.close()
+
+
+def delete_image(name):
+    """Удаляет изображение рецепта вместе с миниатюрами sorl."""
+    try:
+        delete(name)
+    except Exception:
+        logger.exception('Не удалось удалить изображение %s', name)
+
+
+def unprocessed_recipes():
+    """Рецепты с изображением, для которого ещё нет миниатюр.
+
+    Сюда попадают и рецепты, чья обработка потерялась при перезапуске
+    процесса вместе с очередью пула.
+    """
+    return Recipe.objects.exclude(image='').filter(thumbnail_list='')
+
+
+def schedule_image_processing(recipe, previous=''):
+    """Ставит обработку изображения рецепта в очередь после коммита.
+
+    Прежнее изображение previous удаляется после коммита вместе с
+    миниатюрами.
+    """
+    if previous and previous != recipe.image.name:
+        transaction.on_commit(lambda: delete_image(previous))
+    if not recipe.image:
+        return
+    recipe_id, name = recipe.id, recipe.image.name
+    if executor is None:
+        transaction.on_commit(lambda: run_processing(recipe_id, name))
+    else:
+        transaction.on_commit(
+            lambda: executor.submit(run_in_worker, recipe_id, name))
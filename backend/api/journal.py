@@ -0,0 +1,83 @@
+from itertools import chain
+
+from django.core.cache import cache
+from django.db import connections, transaction
+
+CHANGE_TIMEOUT = 24 * 60 * 60
+
+
+def collect_on_commit(name, ids, callback, using='default'):
+    """Копит id до фиксации транзакции и один раз вызывает callback(ids).
+
+    Сигналы строк рецепта приходят по одному на строку; без накопления
+    каждая строка запускала бы свою пересборку. Вне транзакции callback
+    вызывается сразу.
+    """
+    connection = connections[using]
+    if not connection.in_atomic_block:
+        callback(set(ids))
+        return
+    attribute = f'pending_{name}'
+    pending = getattr(connection, attribute, None)
+    if pending is None or not any(
+            func == pending['flush'] for _, func in connection.run_on_commit):
+        pending = {'ids': set()}
+
+        def flush():
+            if getattr(connection, attribute, None) is pending:
+                setattr(connection, attribute, None)
+            callback(pending['ids'])
+
+        pending['flush'] = flush
+        setattr(connection, attribute, pending)
+        pending['ids'].update(ids)
+        transaction.on_commit(flush, using=using)
+        return
+    pending['ids'].update(ids)
+
+
+class ChangeJournal:
+    """Общий журнал изменённых id для индексов в памяти процессов."""
+
+    def __init__(self, name):
+        self.name = name
+        self.sequence_key = f'{name}:sequence'
+        self.change_key = f'{name}:change:{{}}'
+
+    def get_sequence(self):
+        sequence = cache.get(self.sequence_key)
+        if sequence is None:
+            cache.add(self.sequence_key, 0, None)
+            sequence = cache.get(self.sequence_key)
+        return sequence
+
+    def next_sequence(self):
+        try:
+            return cache.incr(self.sequence_key)
+        except ValueError:
+            cache.add(self.sequence_key, 0, None)
+            return cache.incr(self.sequence_key)
+
+    def record(self, ids):
+        cache.set(self.change_key.format(self.next_sequence()), list(ids),
+                  CHANGE_TIMEOUT)
+
+    def reset(self):
+        """Пропускает запись в журнале: индексы пересоберутся целиком."""
+        self.next_sequence()
+
+    def changed(self, ids, using='default'):
+        """Записывает изменение в журнал после фиксации транзакции."""
+        ids = list(ids)
+        if ids:
+            collect_on_commit(self.name, ids, self.record, using)
+
+    def since(self, start, end):
+        """id, изменённые после start до end включительно, или None,
+        если часть журнала уже вытеснена из кэша."""
+        keys = [self.change_key.format(number)
+                for number in range(start + 1, end + 1)]
+        changes = cache.get_many(keys)
+        if len(changes) != len(keys):
+            return None
+        return set(chain.from_iterable(changes.values()))
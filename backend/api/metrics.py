@@ -0,0 +1,187 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10)
+
+HISTOGRAMS = (
+    ('request_duration_seconds', 'total', TIME_BUCKETS,
+     'Время обработки запроса'),
+    ('request_db_duration_seconds', 'db', TIME_BUCKETS,
+     'Время выполнения SQL-запросов'),
+    ('request_serializer_duration_seconds', 'serializer', TIME_BUCKETS,
+     'Время сериализации ответа'),
+    ('request_queries', 'queries', QUERY_BUCKETS,
+     'Число SQL-запросов на запрос'),
+)
+
+COUNTERS = {
+    'db_connections_opened_total': (
+        'database', 'Открыто новых соединений с БД'),
+    'db_connections_reused_total': (
+        'database', 'Повторных использований соединений с БД'),
+    'db_health_check_failures_total': (
+        'database', 'Соединений, закрытых после неудачной проверки'),
+    'db_pool_timeouts_total': (
+        'database', 'Не дождались свободного соединения в пуле'),
+    'cache_hits_total': ('cache', 'Представлений, найденных в кэше'),
+    'cache_misses_total': ('cache', 'Представлений, собранных заново'),
+    'cache_lookup_seconds_total': ('cache', 'Время чтения из кэша'),
+    'cache_build_seconds_total': (
+        'cache', 'Время сборки недостающих представлений'),
+}
+
+current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Показатели одного запроса."""
+
+    def __init__(self, keep_sql=False):
+        self.queries = 0
+        self.db = 0.0
+        self.serializer = 0.0
+        self.total = 0.0
+        self.sql = [] if keep_sql else None
+        self.depth = 0
+
+    def execute(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.queries += 1
+            self.db += duration
+            if self.sql is not None:
+                self.sql.append((duration, sql))
+
+    def server_timing(self):
+        return ', '.join((
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"',
+            f'serializer;dur={self.serializer * 1000:.1f}',
+            f'total;dur={self.total * 1000:.1f}',
+        ))
+
+
+@contextmanager
+def timer():
+    """Учитывает время сериализации; вложенные вызовы не суммируются."""
+    metrics = current.get()
+    if metrics is None:
+        yield
+        return
+    metrics.depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.depth -= 1
+        if not metrics.depth:
+            metrics.serializer += time.perf_counter() - start
+
+
+class TimedSerializerMixin:
+    """Засчитывает to_representation во время сериализации запроса."""
+
+    def to_representation(self, instance):
+        with timer():
+            return super().to_representation(instance)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def histogram_lines(name, label, value, histogram):
+    lines = []
+    total = 0
+    for bound, count in zip(histogram.buckets + ('+Inf',),
+                            histogram.counts):
+        total += count
+        lines.append(f'{name}_bucket{{{label}="{escape(value)}",'
+                     f'le="{bound}"}} {total}')
+    lines.append(f'{name}_sum{{{label}="{escape(value)}"}} {histogram.sum}')
+    lines.append(f'{name}_count{{{label}="{escape(value)}"}} {total}')
+    return lines
+
+
+class Registry:
+    """Показатели запросов, соединений с БД и кэша рецептов."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+        self.counters = defaultdict(int)
+        self.waits = {}
+
+    def observe(self, view, metrics):
+        with self.lock:
+            histograms = self.views.get(view)
+            if histograms is None:
+                histograms = self.views[view] = {
+                    attr: Histogram(buckets)
+                    for _, attr, buckets, _ in HISTOGRAMS}
+            for attr, histogram in histograms.items():
+                histogram.observe(getattr(metrics, attr))
+
+    def inc(self, name, alias, value=1):
+        with self.lock:
+            self.counters[name, alias] += value
+
+    def value(self, name, alias):
+        with self.lock:
+            return self.counters.get((name, alias), 0)
+
+    def observe_wait(self, alias, seconds):
+        with self.lock:
+            histogram = self.waits.get(alias)
+            if histogram is None:
+                histogram = self.waits[alias] = Histogram(WAIT_BUCKETS)
+            histogram.observe(seconds)
+
+    def render(self, prefix='foodgram_'):
+        """Показатели в текстовом формате Prometheus."""
+        lines = []
+        with self.lock:
+            for name, attr, buckets, help_text in HISTOGRAMS:
+                name = prefix + name
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for view, histograms in sorted(self.views.items()):
+                    lines.extend(histogram_lines(name, 'view', view,
+                                                 histograms[attr]))
+            for counter, (label, help_text) in COUNTERS.items():
+                name = prefix + counter
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for (key, alias), value in sorted(self.counters.items()):
+                    if key == counter:
+                        lines.append(
+                            f'{name}{{{label}="{escape(alias)}"}} {value}')
+            name = prefix + 'db_pool_wait_seconds'
+            lines.append(f'# HELP {name} Ожидание соединения из пула')
+            lines.append(f'# TYPE {name} histogram')
+            for alias, histogram in sorted(self.waits.items()):
+                lines.extend(histogram_lines(name, 'database', alias,
+                                             histogram))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
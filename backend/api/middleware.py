@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+from api.metrics import RequestMetrics, current, registry
+from foodgram.settings import METRICS_QUERY_LOG_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.url_name or match.view_name or 'unnamed'
+
+
+class ClosingIterator:
+    """Тело потокового ответа, после которого вызывается callback.
+
+    callback вызывается один раз: когда тело дочитано или когда сервер
+    закрывает ответ, даже если чтение тела так и не началось.
+    """
+
+    def __init__(self, content, callback):
+        self.content = content
+        self.callback = callback
+
+    def __iter__(self):
+        yield from self.content
+        self.close()
+
+    def close(self):
+        callback, self.callback = self.callback, None
+        if callback is not None:
+            callback()
+
+
+class QueryMetricsMiddleware:
+    """Число SQL-запросов и время обработки по каждому представлению.
+
+    Под ASGI запросы к базе выполняются в потоках пула, поэтому там
+    их учитывает api.views.async_views.call через контекст запроса.
+    Потоковый ответ выполняет запросы, пока сервер читает тело, поэтому
+    его показатели записываются после тела, а Server-Timing описывает
+    только время до заголовков.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.acall(request)
+        metrics = RequestMetrics(keep_sql=METRICS_QUERY_LOG_THRESHOLD > 0)
+        token = current.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.execute))
+                response = self.get_response(request)
+        finally:
+            current.reset(token)
+        if response.streaming:
+            return self.stream(request, response, metrics, start)
+        return self.finish(request, response, metrics, start)
+
+    def stream(self, request, response, metrics, start):
+        # Обёртки снимаются по значению, а не со стека: тело, которое
+        # так и не дочитали, не должно снять обёртку чужого запроса.
+        wrapped = list(connections.all())
+        for connection in wrapped:
+            connection.execute_wrappers.append(metrics.execute)
+
+        def close():
+            for connection in wrapped:
+                connection.execute_wrappers.remove(metrics.execute)
+            self.record(request, metrics, start)
+
+        response.streaming_content = ClosingIterator(
+            response.streaming_content, close)
+        metrics.total = time.perf_counter() - start
+        response['Server-Timing'] = metrics.server_timing()
+        return response
+
+    async def acall(self, request):
+        metrics = RequestMetrics(keep_sql=METRICS_QUERY_LOG_THRESHOLD > 0)
+        token = current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, metrics, start)
+
+    def finish(self, request, response, metrics, start):
+        self.record(request, metrics, start)
+        response['Server-Timing'] = metrics.server_timing()
+        return response
+
+    def record(self, request, metrics, start):
+        metrics.total = time.perf_counter() - start
+        view = view_name(request)
+        registry.observe(view, metrics)
+        if 0 < METRICS_QUERY_LOG_THRESHOLD < metrics.queries:
+            logger.warning(
+                '%s %s (%s): %d SQL-запросов за %.1f мс\n%s',
+                request.method, request.path, view, metrics.queries,
+                metrics.db * 1000,
+                '\n'.join(f'[{duration * 1000:.1f} мс] {sql}'
+                          for duration, sql in metrics.sql))
@@ -0,0 +1,29 @@
+from django.http import Http404
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+
+class ReferenceViewSetMixin:
+    """Отдаёт справочник из кэша процесса с поддержкой ETag."""
+    reference = None
+
+    def reference_response(self, request, snapshot, data):
+        etag = self.reference.etag(snapshot)
+        if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            return Response(status=status.HTTP_304_NOT_MODIFIED,
+                            headers={'ETag': etag})
+        return Response(data, headers={'ETag': etag})
+
+    def list(self, request, *args, **kwargs):
+        snapshot = self.reference.get()
+        return self.reference_response(request, snapshot, snapshot.data)
+
+    def retrieve(self, request, *args, **kwargs):
+        snapshot = self.reference.get()
+        try:
+            data = snapshot.rows[int(kwargs[self.lookup_field])]
+        except (KeyError, ValueError):
+            raise Http404
+        return self.reference_response(request, snapshot, data)
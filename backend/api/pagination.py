@@ -1,6 +1,111 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db.models import QuerySet
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
+from rest_framework.response import Response
+
+from foodgram.settings import PAGINATION_COUNT_TIMEOUT
+
+
+def cached_count(queryset):
+    """Количество объектов выборки, закэшированное на короткое время."""
+    if not PAGINATION_COUNT_TIMEOUT:
+        return queryset.count()
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    key = 'count:' + hashlib.md5(
+        f'{sql} {params!r}'.encode()).hexdigest()
+    return cache.get_or_set(key, queryset.count, PAGINATION_COUNT_TIMEOUT)
+
+
+class KeysetPagination(CursorPagination):
+    """Пагинация по ключу id без OFFSET."""
+    page_size = 10
+    max_page_size = 100
+    page_size_query_param = 'limit'
+    ordering = '-id'
+
+    def get_ordering(self, request, queryset, view):
+        """Сортировка по id; другая сортировка выборки не поддерживается.
+
+        Позиция курсора хранит только id, поэтому ?ordering= по счётчикам
+        и выдача поиска по релевантности с курсором не сочетаются.
+        """
+        if not isinstance(queryset, QuerySet):
+            raise ValidationError({self.cursor_query_param: [
+                'Курсор не поддерживает поиск без PostgreSQL.']})
+        ordering = tuple(queryset.query.order_by)
+        if not ordering:
+            return (getattr(view, 'cursor_ordering', self.ordering),)
+        if ordering in (('id',), ('-id',)):
+            return ordering
+        raise ValidationError({self.cursor_query_param: [
+            'Курсор поддерживает только сортировку по id.']})
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.get_ordering(request, queryset, view)
+        self.count = cached_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
 
 
 class CustomPagination(PageNumberPagination):
-    """Пагинация с номерами страниц."""
+    """Пагинация с номерами страниц или по курсору при ?cursor=."""
     page_size_query_param = 'limit'
+    keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if KeysetPagination.cursor_query_param in request.query_params:
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class FeedPagination(KeysetPagination):
+    """Курсор по id последнего рецепта для ленты, собранной из кэша."""
+
+    def paginate_feed(self, fetch, request):
+        """fetch(before, limit) возвращает рецепты и признак продолжения."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        before = None
+        if cursor is not None and cursor.position is not None:
+            try:
+                before = int(cursor.position)
+            except ValueError:
+                raise NotFound(self.invalid_cursor_message)
+        self.page, self.has_next = fetch(before, page_size)
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(Cursor(
+            offset=0, reverse=False, position=str(self.page[-1].id)))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
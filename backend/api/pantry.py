@@ -0,0 +1,142 @@
+import heapq
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from itertools import chain, compress
+from operator import sub
+
+from api.journal import ChangeJournal
+from recipes.models import RecipeIngredient
+
+# Больше изменений дешевле применить полной пересборкой.
+MAX_REPLAY = 1000
+
+
+class PantryIndex:
+    """Ингредиент -> отсортированный массив id рецептов.
+
+    Для каждого рецепта хранится число его ингредиентов, чтобы считать
+    покрытие и недостающие ингредиенты без обращения к базе, и сами
+    ингредиенты, чтобы изменение рецепта трогало только его списки.
+    """
+    def __init__(self, rows=()):
+        postings = defaultdict(list)
+        recipes = defaultdict(list)
+        for recipe_id, ingredient_id in rows:
+            postings[ingredient_id].append(recipe_id)
+            recipes[recipe_id].append(ingredient_id)
+        self.postings = {}
+        for ingredient_id, recipe_ids in postings.items():
+            recipe_ids.sort()
+            self.postings[ingredient_id] = array('I', recipe_ids)
+        self.recipes = {recipe_id: tuple(ingredient_ids)
+                        for recipe_id, ingredient_ids in recipes.items()}
+        self.sizes = array('H')
+        if self.recipes:
+            self.grow(max(self.recipes))
+        for recipe_id, ingredient_ids in self.recipes.items():
+            self.sizes[recipe_id] = len(ingredient_ids)
+
+    def grow(self, recipe_id):
+        missing = recipe_id + 1 - len(self.sizes)
+        if missing > 0:
+            self.sizes.extend(array('H', bytes(2 * missing)))
+
+    def remove(self, recipe_id):
+        for ingredient_id in self.recipes.pop(recipe_id, ()):
+            recipe_ids = self.postings[ingredient_id]
+            del recipe_ids[bisect_left(recipe_ids, recipe_id)]
+        if recipe_id < len(self.sizes):
+            self.sizes[recipe_id] = 0
+
+    def add(self, recipe_id, ingredient_ids):
+        self.grow(recipe_id)
+        for ingredient_id in ingredient_ids:
+            recipe_ids = self.postings.setdefault(ingredient_id, array('I'))
+            recipe_ids.insert(bisect_left(recipe_ids, recipe_id), recipe_id)
+        self.recipes[recipe_id] = tuple(ingredient_ids)
+        self.sizes[recipe_id] = len(ingredient_ids)
+
+    def update(self, recipes):
+        """Заменяет ингредиенты рецептов; пустой набор удаляет рецепт."""
+        for recipe_id, ingredient_ids in recipes.items():
+            self.remove(recipe_id)
+            if ingredient_ids:
+                self.add(recipe_id, ingredient_ids)
+
+    def match(self, ingredient_ids, limit, max_missing=None):
+        """Лучшие рецепты: меньше недостающих, затем выше покрытие.
+
+        Возвращает кортежи (id рецепта, совпало, недостаёт).
+        """
+        matched = Counter(chain.from_iterable(
+            self.postings.get(ingredient_id, ())
+            for ingredient_id in set(ingredient_ids)))
+        if not matched:
+            return []
+        recipe_ids = list(matched)
+        counts = list(matched.values())
+        missing = list(map(sub, map(self.sizes.__getitem__, recipe_ids),
+                           counts))
+        # Порог по недостающим отбирает кандидатов без цикла на Python;
+        # ключ с покрытием считается только для оставшихся.
+        threshold = heapq.nsmallest(limit, missing)[-1]
+        if max_missing is not None:
+            threshold = min(threshold, max_missing)
+        selected = compress(zip(recipe_ids, counts, missing),
+                            map(threshold.__ge__, missing))
+        return sorted(
+            selected,
+            key=lambda item: (item[2], -item[1] / (item[1] + item[2]),
+                              -item[0]))[:limit]
+
+
+def recipe_ingredients(recipe_ids):
+    recipes = {recipe_id: [] for recipe_id in recipe_ids}
+    for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+            recipe_id__in=recipes).values_list('recipe_id', 'ingredient_id'):
+        recipes[recipe_id].append(ingredient_id)
+    return recipes
+
+
+class PantryIndexCache:
+    """Индекс процесса, догоняющий общий журнал изменённых рецептов."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.journal = ChangeJournal('pantry_index')
+        self.index = None
+        self.sequence = None
+
+    def changed(self, recipe_ids):
+        """Записывает изменение рецептов в журнал после фиксации."""
+        self.journal.changed(recipe_ids)
+
+    def rebuild(self, sequence):
+        self.index = PantryIndex(
+            RecipeIngredient.objects.order_by()
+            .values_list('recipe_id', 'ingredient_id').iterator())
+        self.sequence = sequence
+
+    def refresh(self):
+        sequence = self.journal.get_sequence()
+        if self.index is None or not (
+                self.sequence <= sequence <= self.sequence + MAX_REPLAY):
+            self.rebuild(sequence)
+            return
+        if sequence == self.sequence:
+            return
+        changed = self.journal.since(self.sequence, sequence)
+        if changed is None:
+            self.rebuild(sequence)
+            return
+        self.index.update(recipe_ingredients(changed))
+        self.sequence = sequence
+
+    def match(self, ingredient_ids, limit, max_missing=None):
+        with self.lock:
+            self.refresh()
+            return self.index.match(ingredient_ids, limit, max_missing)
+
+
+pantry_index = PantryIndexCache()
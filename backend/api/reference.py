@@ -0,0 +1,77 @@
+import time
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db import transaction
+
+from foodgram.settings import REFERENCE_CACHE_TTL
+from recipes.models import Ingredient, Tag
+
+Snapshot = namedtuple('Snapshot',
+                      ('version', 'objects', 'rows', 'data', 'loaded'))
+
+
+class ReferenceCache:
+    """Копия справочника в памяти процесса с версией в общем кэше.
+
+    Копия перечитывается при смене версии и не реже раза в
+    REFERENCE_CACHE_TTL секунд: с кэшем в памяти процесса версию меняет
+    только процесс, в котором изменили справочник.
+    """
+    def __init__(self, model):
+        self.model = model
+        self.name = model._meta.model_name
+        self.version_key = f'reference_version:{model._meta.label_lower}'
+        self.snapshot = None
+
+    def get_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, time.time_ns(), None)
+            version = cache.get(self.version_key)
+        return version
+
+    def bump(self):
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, time.time_ns(), None)
+
+    def invalidate(self):
+        transaction.on_commit(self.bump)
+
+    def load(self, version):
+        queryset = self.model.objects.all()
+        data = list(queryset.values())
+        rows = {row['id']: row for row in data}
+        return Snapshot(
+            version=version,
+            objects={
+                pk: self.model.from_db(queryset.db, list(row),
+                                       list(row.values()))
+                for pk, row in rows.items()
+            },
+            rows=rows,
+            data=data,
+            loaded=time.monotonic(),
+        )
+
+    def get(self):
+        version = self.get_version()
+        snapshot = self.snapshot
+        if snapshot is None or snapshot.version != version:
+            snapshot = self.snapshot = self.load(version)
+        elif time.monotonic() - snapshot.loaded > REFERENCE_CACHE_TTL:
+            fresh = self.load(version)
+            if fresh.data != snapshot.data:
+                self.bump()
+                fresh = fresh._replace(version=self.get_version())
+            snapshot = self.snapshot = fresh
+        return snapshot
+
+    def etag(self, snapshot):
+        return f'"{self.name}-{snapshot.version}"'
+
+
+tag_reference = ReferenceCache(Tag)
+ingredient_reference = ReferenceCache(Ingredient)
@@ -0,0 +1,27 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+class ExportRenderer(BaseRenderer):
+    """Базовый рендерер для выгрузки файлов."""
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not isinstance(data, str):
+            data = json.dumps(data, ensure_ascii=False)
+        return data.encode(self.charset)
+
+
+class PlainTextRenderer(ExportRenderer):
+    """Рендерер для выгрузки в текстовом формате."""
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVRenderer(ExportRenderer):
+    """Рендерер для выгрузки в формате CSV."""
+    media_type = 'text/csv'
+    format = 'csv'
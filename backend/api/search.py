@@ -0,0 +1,376 @@
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from django.db import connections
+from django.db.models import Case, F, FloatField, Value, When
+
+from api.journal import ChangeJournal, collect_on_commit
+from foodgram.settings import SEARCH_CONFIG
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            RecipeSearch)
+
+TOKEN = re.compile(r'\w+')
+CLAUSE = re.compile(r'"([^"]*)"?|(\S+)')
+
+# Веса полей совпадают с весами ts_rank по умолчанию для A, B и C.
+WEIGHTS = (1.0, 0.4, 0.2)
+FIELD_SPAN = 10 ** 6
+# Больше изменений дешевле применить полной пересборкой.
+MAX_REPLAY = 1000
+
+UPDATE_SQL = '''
+INSERT INTO {search} (recipe_id, vector)
+SELECT recipe.id,
+       setweight(to_tsvector(%(config)s::regconfig, recipe.name), 'A')
+       || setweight(to_tsvector(%(config)s::regconfig,
+                                coalesce(string_agg(ingredient.name, ' '),
+                                         '')), 'B')
+       || setweight(to_tsvector(%(config)s::regconfig, recipe.text), 'C')
+FROM {recipe} recipe
+LEFT JOIN {amount} amount ON amount.recipe_id = recipe.id
+LEFT JOIN {ingredient} ingredient ON ingredient.id = amount.ingredient_id
+WHERE {where}
+GROUP BY recipe.id
+ON CONFLICT (recipe_id) DO UPDATE SET vector = EXCLUDED.vector
+'''
+
+
+def tokenize(text):
+    return [token.casefold().replace('ё', 'е')
+            for token in TOKEN.findall(text)]
+
+
+def parse_query(query):
+    """Условия запроса: фразы в кавычках, префиксы со * и отдельные слова."""
+    clauses = []
+    for phrase, word in CLAUSE.findall(query):
+        if phrase:
+            tokens = tokenize(phrase)
+            if len(tokens) > 1:
+                clauses.append(('phrase', tuple(tokens)))
+            else:
+                clauses.extend(('word', token) for token in tokens)
+            continue
+        tokens = tokenize(word)
+        if tokens and word.endswith('*'):
+            clauses.extend(('word', token) for token in tokens[:-1])
+            clauses.append(('prefix', tokens[-1]))
+        else:
+            clauses.extend(('word', token) for token in tokens)
+    return clauses
+
+
+def is_postgresql(alias):
+    return connections[alias].vendor == 'postgresql'
+
+
+class InvertedIndex:
+    """Слово -> {id рецепта: позиции}; поля разнесены по позициям."""
+
+    def __init__(self, documents=()):
+        self.postings = {}
+        self.recipe_tokens = {}
+        for recipe_id, fields in documents:
+            self.add(recipe_id, fields)
+        self.tokens = sorted(self.postings)
+
+    def add(self, recipe_id, fields):
+        """Добавляет документ рецепта и возвращает новые слова словаря."""
+        tokens, new = set(), []
+        for field, text in enumerate(fields):
+            for position, token in enumerate(tokenize(text),
+                                             field * FIELD_SPAN):
+                recipes = self.postings.get(token)
+                if recipes is None:
+                    recipes = self.postings[token] = {}
+                    new.append(token)
+                recipes.setdefault(recipe_id, []).append(position)
+                tokens.add(token)
+        self.recipe_tokens[recipe_id] = tokens
+        return new
+
+    def remove(self, recipe_id):
+        for token in self.recipe_tokens.pop(recipe_id, ()):
+            recipes = self.postings[token]
+            del recipes[recipe_id]
+            if not recipes:
+                del self.postings[token]
+                del self.tokens[bisect_left(self.tokens, token)]
+
+    def update(self, documents):
+        """Заменяет документы рецептов; None удаляет рецепт."""
+        for recipe_id, fields in documents.items():
+            self.remove(recipe_id)
+            if fields is not None:
+                for token in self.add(recipe_id, fields):
+                    insort(self.tokens, token)
+
+    def lookup(self, kind, value):
+        if kind == 'word':
+            return self.postings.get(value, {})
+        if kind == 'prefix':
+            found = defaultdict(list)
+            index = bisect_left(self.tokens, value)
+            while (index < len(self.tokens)
+                   and self.tokens[index].startswith(value)):
+                for recipe_id, positions in self.postings[
+                        self.tokens[index]].items():
+                    found[recipe_id].extend(positions)
+                index += 1
+            return found
+        first, *rest = value
+        following = [self.postings.get(token, {}) for token in rest]
+        found = {}
+        for recipe_id, positions in self.postings.get(first, {}).items():
+            sets = [set(postings.get(recipe_id, ())) for postings in following]
+            if not all(sets):
+                continue
+            matched = [
+                position for position in positions
+                if all(position + offset in found_positions
+                       for offset, found_positions in enumerate(sets, 1))
+            ]
+            if matched:
+                found[recipe_id] = matched
+        return found
+
+    def search(self, clauses):
+        """Рецепты, подходящие под все условия, по убыванию веса."""
+        scores = None
+        for clause in clauses:
+            found = {
+                recipe_id: sum(WEIGHTS[position // FIELD_SPAN]
+                               for position in positions)
+                for recipe_id, positions in self.lookup(*clause).items()
+            }
+            if scores is None:
+                scores = found
+            else:
+                scores = {recipe_id: score + found[recipe_id]
+                          for recipe_id, score in scores.items()
+                          if recipe_id in found}
+            if not scores:
+                return []
+        return sorted(scores.items(), key=lambda item: (item[1], item[0]),
+                      reverse=True)
+
+
+def recipe_documents(recipe_ids=None):
+    """Поля рецептов для индекса: название, ингредиенты, описание."""
+    recipes = Recipe.objects.order_by()
+    amounts = RecipeIngredient.objects.order_by()
+    if recipe_ids is not None:
+        recipes = recipes.filter(id__in=recipe_ids)
+        amounts = amounts.filter(recipe_id__in=recipe_ids)
+    ingredients = defaultdict(list)
+    for recipe_id, name in (amounts.values_list('recipe_id',
+                                                'ingredient__name')
+                            .iterator()):
+        ingredients[recipe_id].append(name)
+    for recipe_id, name, text in (recipes.values_list('id', 'name', 'text')
+                                  .iterator()):
+        yield recipe_id, (name, ' '.join(ingredients[recipe_id]), text)
+
+
+class RecipeIndexCache:
+    """Индекс процесса, догоняющий общий журнал изменённых рецептов."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.journal = ChangeJournal('search_index')
+        self.index = None
+        self.sequence = None
+
+    def changed(self, recipe_ids, using='default'):
+        self.journal.changed(recipe_ids, using)
+
+    def rebuild(self, sequence):
+        self.index = InvertedIndex(recipe_documents())
+        self.sequence = sequence
+
+    def refresh(self):
+        sequence = self.journal.get_sequence()
+        if self.index is None or not (
+                self.sequence <= sequence <= self.sequence + MAX_REPLAY):
+            self.rebuild(sequence)
+            return
+        if sequence == self.sequence:
+            return
+        changed = self.journal.since(self.sequence, sequence)
+        if changed is None:
+            self.rebuild(sequence)
+            return
+        documents = dict.fromkeys(changed)
+        documents.update(recipe_documents(changed))
+        self.index.update(documents)
+        self.sequence = sequence
+
+    def search(self, clauses):
+        with self.lock:
+            self.refresh()
+            return self.index.search(clauses)
+
+
+recipe_index = RecipeIndexCache()
+
+
+def search_query(clauses):
+    from django.contrib.postgres.search import SearchQuery
+
+    query = None
+    for kind, value in clauses:
+        if kind == 'phrase':
+            part = SearchQuery(' '.join(value), search_type='phrase',
+                               config=SEARCH_CONFIG)
+        elif kind == 'prefix':
+            part = SearchQuery(f'{value}:*', search_type='raw',
+                               config=SEARCH_CONFIG)
+        else:
+            part = SearchQuery(value, config=SEARCH_CONFIG)
+        query = part if query is None else query & part
+    return query
+
+
+def id_batch_size(queryset, ids):
+    """Сколько id передавать в одном запросе к базе выборки."""
+    return max(connections[queryset.db].ops.bulk_batch_size(['id'], ids), 1)
+
+
+class RankedRecipes:
+    """Выдача поиска по индексу в памяти процесса.
+
+    Найденные id сверяются с остальными фильтрами пакетами и
+    упорядочиваются в Python, а рецепты запрашиваются только для нужной
+    страницы: id__in со всеми найденными рецептами упирается в лимит
+    параметров SQLite. Срез возвращает QuerySet, поэтому выдачу
+    принимают Paginator и представления рецептов.
+    """
+    ordered = True
+
+    def __init__(self, queryset, ranked):
+        self.queryset = queryset
+        self.model = queryset.model
+        self.scores = dict(ranked)
+        ordering = queryset.query.order_by
+        fields = [name.lstrip('-') for name in ordering]
+        ids = list(self.scores)
+        size = id_batch_size(queryset, ids)
+        rows = {}
+        for start in range(0, len(ids), size):
+            rows.update(
+                (row[0], row[1:]) for row in queryset.order_by()
+                .filter(id__in=ids[start:start + size])
+                .values_list('id', *fields))
+        self.ids = [recipe_id for recipe_id in ids if recipe_id in rows]
+        if ordering:
+            # Явная сортировка (?ordering=) вместо релевантности.
+            self.scores = None
+            self.ids.sort(reverse=True)
+            for index, name in reversed(list(enumerate(ordering))):
+                self.ids.sort(key=lambda recipe_id: rows[recipe_id][index],
+                              reverse=name.startswith('-'))
+
+    def count(self):
+        return len(self.ids)
+
+    __len__ = count
+
+    def page(self, ids):
+        queryset = self.queryset.filter(id__in=ids)
+        if self.scores is None:
+            return queryset
+        return queryset.annotate(search_rank=Case(
+            *(When(id=recipe_id, then=Value(self.scores[recipe_id]))
+              for recipe_id in ids),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )).order_by('-search_rank', '-id')
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.page(self.ids[index])
+        return self.page([self.ids[index]]).get()
+
+    def __iter__(self):
+        # Страница передаёт каждый id дважды: в id__in и в CASE.
+        size = max(id_batch_size(self.queryset, self.ids) // 2, 1)
+        for start in range(0, len(self.ids), size):
+            yield from self[start:start + size]
+
+    def filter(self, *args, **kwargs):
+        """Узкая выборка из выдачи, например рецепт по pk."""
+        queryset = self.queryset.filter(*args, **kwargs)
+        found = RankedRecipes(queryset.order_by(),
+                              [(recipe_id, 0.0) for recipe_id in self.ids])
+        return queryset.filter(id__in=found.ids)
+
+    def get(self, *args, **kwargs):
+        return self.filter(*args, **kwargs).get()
+
+
+def search_recipes(queryset, text):
+    """Рецепты, подходящие под запрос, по убыванию релевантности.
+
+    Явная сортировка выборки (?ordering=) сохраняется, поэтому поиск
+    применяется к выборке последним.
+    """
+    clauses = parse_query(text)
+    if not clauses:
+        return queryset.none()
+    if is_postgresql(queryset.db):
+        from django.contrib.postgres.search import SearchRank
+
+        query = search_query(clauses)
+        rank = SearchRank(F('search__vector'), query)
+        queryset = (queryset.filter(search__vector__match=query)
+                    .annotate(search_rank=rank))
+        if queryset.query.order_by:
+            return queryset
+        return queryset.order_by('-search_rank', '-id')
+    ranked = recipe_index.search(clauses)
+    if not ranked:
+        return queryset.none()
+    return RankedRecipes(queryset, ranked)
+
+
+def update_documents(recipe_ids=None, using='default', batch_size=10000):
+    """Пересобирает поисковые документы рецептов в PostgreSQL.
+
+    Без recipe_ids обходит все рецепты диапазонами id.
+    """
+    connection = connections[using]
+    sql = UPDATE_SQL.format(
+        search=RecipeSearch._meta.db_table,
+        recipe=Recipe._meta.db_table,
+        amount=RecipeIngredient._meta.db_table,
+        ingredient=Ingredient._meta.db_table,
+        where=('recipe.id = ANY(%(ids)s)' if recipe_ids is not None
+               else 'recipe.id > %(start)s AND recipe.id <= %(end)s'),
+    )
+    with connection.cursor() as cursor:
+        if recipe_ids is not None:
+            recipe_ids = list(recipe_ids)
+            for start in range(0, len(recipe_ids), batch_size):
+                cursor.execute(sql, {
+                    'config': SEARCH_CONFIG,
+                    'ids': recipe_ids[start:start + batch_size]})
+            return
+        last = (Recipe.objects.using(using).order_by('-id')
+                .values_list('id', flat=True).first() or 0)
+        for start in range(0, last, batch_size):
+            cursor.execute(sql, {'config': SEARCH_CONFIG, 'start': start,
+                                 'end': start + batch_size})
+
+
+def reindex(recipe_ids, using='default'):
+    """Обновляет поиск по рецептам после фиксации транзакции."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    if not is_postgresql(using):
+        recipe_index.changed(recipe_ids, using)
+        return
+    collect_on_commit('search_reindex', recipe_ids,
+                      lambda ids: update_documents(ids, using), using)
@@ -1,17 +1,59 @@
 from django.db import transaction
-from django.shortcuts import get_object_or_404
+from django.db.models import prefetch_related_objects
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import status, serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework.fields import IntegerField
 from rest_framework.fields import SerializerMethodField
-from rest_framework.relations import PrimaryKeyRelatedField
 
-from api.fields import Base64ImageField
-from recipes.models import Ingredient, RecipeIngredient, Recipe, Tag
+from api import totals
+from api.cache import get_recipes
+from api.counters import update_counter
+from api.diff import diff_recipe
+from api.fields import (Base64ImageField, ReferencePrimaryKeyField,
+                        ThumbnailImageField)
+from api.images import schedule_image_processing
+from api.metrics import TimedSerializerMixin, timer
+from api.reference import ingredient_reference, tag_reference
+from foodgram.settings import (BATCH_SIZE_LIMIT, PANTRY_RESULTS_LIMIT,
+                               SHOPPING_CART_MAX_SERVINGS,
+                               SUBSCRIPTION_RECIPES_LIMIT)
+from recipes.models import (Ingredient, RecipeIngredient, Recipe,
+                            RecipeQuerySet, ShoppingCartTotal, Tag)
 from users.models import User, Subscription
 
 
+class IdListSerializer(serializers.Serializer):
+    """Сериализатор списка идентификаторов для пакетных операций."""
+    ids = serializers.ListField(
+        child=IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BATCH_SIZE_LIMIT,
+    )
+
+    def validate_ids(self, value):
+        return list(dict.fromkeys(value))
+
+
+class ServingsSerializer(serializers.Serializer):
+    """Число порций рецепта в списке покупок."""
+    servings = IntegerField(min_value=1,
+                            max_value=SHOPPING_CART_MAX_SERVINGS,
+                            default=1)
+
+
+class PantrySerializer(serializers.Serializer):
+    """Параметры подбора рецептов по имеющимся ингредиентам."""
+    ingredients = serializers.ListField(
+        child=IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BATCH_SIZE_LIMIT,
+    )
+    limit = IntegerField(min_value=1, max_value=PANTRY_RESULTS_LIMIT,
+                         default=10)
+    max_missing = IntegerField(min_value=0, required=False)
+
+
 class CreateUserSerializer(UserCreateSerializer):
     """Сериализатор для создания новых пользователей."""
     class Meta:
@@ -29,7 +71,7 @@ class CreateUserSerializer(UserCreateSerializer):
         return value
 
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(TimedSerializerMixin, UserSerializer):
     """Сериализатор для модели User."""
     is_subscribed = SerializerMethodField(read_only=True)
 
@@ -41,12 +83,29 @@ class CustomUserSerializer(UserSerializer):
                   )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         return not user.is_anonymous and Subscription.objects.filter(
             user=user, author=obj).exists()
 
 
-class SubscriptionSerializer(UserSerializer):
+def get_recipes_limit(request):
+    """Число рецептов автора в подписках из ?recipes_limit= с ограничением."""
+    limit = request.query_params.get('recipes_limit')
+    if not limit:
+        return SUBSCRIPTION_RECIPES_LIMIT
+    try:
+        limit = int(limit)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        raise ValidationError(
+            {'recipes_limit': 'Должно быть целым положительным числом'})
+    return min(limit, SUBSCRIPTION_RECIPES_LIMIT)
+
+
+class SubscriptionSerializer(TimedSerializerMixin, UserSerializer):
     """Сериализатор для модели Subscription."""
     recipes_count = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
@@ -71,27 +130,28 @@ class SubscriptionSerializer(UserSerializer):
         return value
 
     def get_recipes_count(self, value):
-        return value.recipes.count()
+        return value.recipes_count
 
     def get_recipes(self, value):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = value.recipes.all()
-        if limit:
-            recipes = recipes[:int(limit)]
+        if hasattr(value, 'latest_recipes'):
+            recipes = value.latest_recipes
+        else:
+            limit = get_recipes_limit(self.context.get('request'))
+            recipes = value.recipes.all()[:limit]
         serializer = RecipeFavoriteSerializer(recipes,
                                               many=True, read_only=True)
         return serializer.data
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin,
+                           serializers.ModelSerializer):
     """Сериализатор для модели Ingredient."""
     class Meta:
         model = Ingredient
         fields = '__all__'
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для модели Tag."""
     class Meta:
         model = Tag
@@ -111,6 +171,43 @@ class RecipeIngredientListSerializer(serializers.ModelSerializer):
                   'measurement_unit', 'amount')
 
 
+class RecipeAuthorSerializer(serializers.ModelSerializer):
+    """Сериализатор автора рецепта без данных текущего пользователя."""
+    class Meta:
+        model = User
+        fields = ('email', 'id',
+                  'username', 'first_name',
+                  'last_name',
+                  )
+
+
+class RecipePublicSerializer(serializers.ModelSerializer):
+    """Сериализатор общей для всех пользователей части рецепта."""
+    author = RecipeAuthorSerializer(read_only=True)
+    tags = TagSerializer(many=True, read_only=True)
+    ingredients = RecipeIngredientListSerializer(many=True,
+                                                 read_only=True,
+                                                 source='recipes')
+    image = Base64ImageField(required=False, allow_null=True)
+    thumbnail_list = ThumbnailImageField('thumbnail_list')
+    thumbnail_detail = ThumbnailImageField('thumbnail_detail')
+
+    class Meta:
+        model = Recipe
+        fields = ('id', 'tags',
+                  'author', 'ingredients',
+                  'name', 'image',
+                  'text', 'cooking_time',
+                  'thumbnail_list', 'thumbnail_detail',
+                  )
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Сериализатор списка рецептов с общим обращением к кэшу."""
+    def to_representation(self, data):
+        return self.child.represent(list(data))
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для модели Recipe."""
     author = CustomUserSerializer(read_only=True)
@@ -130,17 +227,75 @@ class RecipeSerializer(serializers.ModelSerializer):
                   'name', 'image',
                   'text', 'cooking_time',
                   )
+        list_serializer_class = RecipeListSerializer
 
     def get_is_favorited(self, value):
+        if hasattr(value, 'is_favorited'):
+            return value.is_favorited
         user = self.context.get('request').user
         return not user.is_anonymous and user.favorites_user.filter(
             recipe=value).exists()
 
     def get_is_in_shopping_cart(self, value):
+        if hasattr(value, 'is_in_shopping_cart'):
+            return value.is_in_shopping_cart
         return (self.context.get('request').user.is_authenticated
                 and self.context.get('request').user.shopping_user.filter(
                     recipe=value).exists())
 
+    def get_is_subscribed(self, value):
+        if hasattr(value, 'is_subscribed'):
+            return value.is_subscribed
+        user = self.context.get('request').user
+        return not user.is_anonymous and Subscription.objects.filter(
+            user=user, author_id=value.author_id).exists()
+
+    @staticmethod
+    def build_public(recipes):
+        prefetch_related_objects(recipes, 'author',
+                                 *RecipeQuerySet.related_lookups())
+        return {recipe.id: RecipePublicSerializer(recipe).data
+                for recipe in recipes}
+
+    def get_image_key(self):
+        action = getattr(self.context.get('view'), 'action', None)
+        if action in ('list', 'feed', 'pantry', 'recommended', 'similar'):
+            return 'thumbnail_list'
+        if action == 'retrieve':
+            return 'thumbnail_detail'
+        return 'image'
+
+    def represent(self, recipes):
+        with timer():
+            return self.build_representation(recipes)
+
+    def get_public(self, recipes):
+        """Общие поля рецептов; ответ на запись собирается мимо кэша."""
+        if self.context.get('uncached'):
+            return self.build_public(recipes)
+        return get_recipes(recipes, self.build_public)
+
+    def build_representation(self, recipes):
+        public = self.get_public(recipes)
+        request = self.context.get('request')
+        image_key = self.get_image_key()
+        representation = []
+        for recipe in recipes:
+            data = dict(public[recipe.id])
+            data['author'] = dict(data['author'],
+                                  is_subscribed=self.get_is_subscribed(recipe))
+            data['is_favorited'] = self.get_is_favorited(recipe)
+            data['is_in_shopping_cart'] = self.get_is_in_shopping_cart(recipe)
+            data['image'] = data.get(image_key, data['image'])
+            if data['image'] and request is not None:
+                data['image'] = request.build_absolute_uri(data['image'])
+            representation.append(
+                {field: data[field] for field in self.Meta.fields})
+        return representation
+
+    def to_representation(self, instance):
+        return self.represent([instance])[0]
+
 
 class RecipeIngredientSerializer(serializers.ModelSerializer):
     """Сериализатор для модели RecipeIngredient."""
@@ -155,8 +310,8 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
     """Сериализатор для модели RecipeCreate."""
     author = UserSerializer(read_only=True)
     ingredients = RecipeIngredientSerializer(many=True)
-    tags = PrimaryKeyRelatedField(queryset=Tag.objects.all(),
-                                  many=True)
+    tags = ReferencePrimaryKeyField(reference=tag_reference,
+                                    many=True)
     image = Base64ImageField(required=False, allow_null=True)
 
     class Meta:
@@ -172,14 +327,27 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         if not value:
             raise ValidationError({'Поле не должно быть пустым'})
 
-        ingredients_list = [get_object_or_404(Ingredient, id=item['id'])
-                            for item in value]
-        if len(set(ingredients_list)) != len(ingredients_list):
-            raise ValidationError({'Ингредиенты не должны повторяться'})
-
-        if any(int(item['amount']) <= 0
-               for item in value):
-            raise ValidationError({'Количество должно быть больше нуля'})
+        ingredients = ingredient_reference.get().objects
+        ids = [item['id'] for item in value]
+        unknown = set(ids) - ingredients.keys()
+        if unknown:
+            ingredients = {**ingredients,
+                           **Ingredient.objects.in_bulk(unknown)}
+
+        errors = []
+        missing = sorted(set(ids) - ingredients.keys())
+        if missing:
+            errors.append('Ингредиенты не найдены: '
+                          + ', '.join(map(str, missing)))
+        if len(set(ids)) != len(ids):
+            errors.append('Ингредиенты не должны повторяться')
+        if any(int(item['amount']) <= 0 for item in value):
+            errors.append('Количество должно быть больше нуля')
+        if errors:
+            raise ValidationError(errors)
+
+        for item in value:
+            item['ingredient'] = ingredients[item['id']]
         return value
 
     def validate_tags(self, value):
@@ -195,7 +363,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         for ingredient in ingredients:
             ingredient_value.append(
                 RecipeIngredient(
-                    ingredient_id=ingredient['id'],
+                    ingredient=ingredient['ingredient'],
                     recipe=recipe,
                     amount=ingredient['amount']
                 )
@@ -207,30 +375,43 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(**validated_data)
+        update_counter(User.objects.filter(id=recipe.author_id),
+                       'recipes_count', 1)
         recipe.tags.set(tags)
         self.ingredient_amounts(recipe=recipe,
                                 ingredients=ingredients)
+        schedule_image_processing(recipe)
         return recipe
 
     @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-        instance.tags.clear()
-        instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.ingredient_amounts(recipe=instance,
-                                ingredients=ingredients)
-        return super().update(instance, validated_data)
+        self.changes = diff_recipe(instance, tags, ingredients)
+        with totals.suspend():
+            self.changes.apply(instance)
+            ShoppingCartTotal.objects.add_recipe_amounts(
+                instance.shopping_recipe.all(),
+                self.changes.amount_deltas())
+        previous = instance.image.name
+        if 'image' in validated_data:
+            validated_data.update(thumbnail_list='', thumbnail_detail='')
+        instance = super().update(instance, validated_data)
+        if 'image' in validated_data:
+            schedule_image_processing(instance, previous)
+        return instance
 
     def to_representation(self, instance):
         return RecipeSerializer(instance,
-                                context=self.context).data
+                                context={**self.context,
+                                         'uncached': True}).data
 
 
-class RecipeFavoriteSerializer(serializers.ModelSerializer):
+class RecipeFavoriteSerializer(TimedSerializerMixin,
+                               serializers.ModelSerializer):
     """Сериализатор для модели RecipeFavorite."""
-    image = Base64ImageField(required=False, allow_null=True)
+    image = ThumbnailImageField('thumbnail_list')
+    source_fields = ('id', 'name', 'image', 'thumbnail_list', 'cooking_time')
 
     class Meta:
         model = Recipe
@@ -0,0 +1,150 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from api import totals
+from api.cache import invalidate_recipes
+from api.feed import (recipe_published, recipe_removed,
+                      subscriptions_changed)
+from api.pantry import pantry_index
+from api.reference import ingredient_reference, tag_reference
+from api.search import reindex
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from users.models import Subscription, User
+
+
+def previous_values(sender, instance, fields):
+    """Сохранённые в базе значения полей изменяемого объекта."""
+    if instance._state.adding or totals.suspended.get():
+        return None
+    return sender.objects.filter(pk=instance.pk).values(*fields).first()
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    invalidate_recipes([instance.id])
+    reindex([instance.id])
+    pantry_index.changed([instance.id])
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        recipe_published(instance.id, instance.author_id)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    recipe_removed(instance.author_id)
+
+
+@receiver([post_save, post_delete], sender=Subscription)
+def subscription_changed(sender, instance, **kwargs):
+    subscriptions_changed([instance.user_id])
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    invalidate_recipes([instance.recipe_id])
+    reindex([instance.recipe_id])
+    pantry_index.changed([instance.recipe_id])
+
+
+@receiver(pre_save, sender=ShoppingCart)
+def shopping_cart_saving(sender, instance, **kwargs):
+    instance.previous = previous_values(
+        sender, instance, ('user_id', 'recipe_id', 'servings'))
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, 'previous', None)
+    servings = instance.servings
+    if previous is not None:
+        if (previous['user_id'], previous['recipe_id']) == (
+                instance.user_id, instance.recipe_id):
+            servings -= previous['servings']
+        else:
+            totals.cart_changed(previous['user_id'], previous['recipe_id'],
+                                -previous['servings'])
+    elif not created:
+        return
+    totals.cart_changed(instance.user_id, instance.recipe_id, servings)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def shopping_cart_deleted(sender, instance, **kwargs):
+    totals.cart_changed(instance.user_id, instance.recipe_id,
+                        -instance.servings)
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def recipe_ingredient_saving(sender, instance, **kwargs):
+    instance.previous = previous_values(
+        sender, instance, ('recipe_id', 'ingredient_id', 'amount'))
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def recipe_ingredient_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, 'previous', None)
+    amount = instance.amount
+    if previous is not None:
+        if (previous['recipe_id'], previous['ingredient_id']) == (
+                instance.recipe_id, instance.ingredient_id):
+            amount -= previous['amount']
+        else:
+            totals.ingredient_changed(previous['recipe_id'],
+                                      previous['ingredient_id'],
+                                      -previous['amount'])
+    elif not created:
+        return
+    totals.ingredient_changed(instance.recipe_id, instance.ingredient_id,
+                              amount)
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_deleted(sender, instance, **kwargs):
+    totals.ingredient_changed(instance.recipe_id, instance.ingredient_id,
+                              -instance.amount)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_recipes([instance.id])
+    elif pk_set:
+        invalidate_recipes(pk_set)
+    else:
+        invalidate_recipes(instance.recipes.values_list('id', flat=True))
+
+
+@receiver([post_save, pre_delete], sender=Tag)
+@receiver([post_save, pre_delete], sender=Ingredient)
+def reference_changed(sender, instance, **kwargs):
+    invalidate_recipes(instance.recipes.values_list('id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def tag_reference_changed(sender, **kwargs):
+    tag_reference.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def ingredient_reference_changed(sender, **kwargs):
+    ingredient_reference.invalidate()
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_renamed(sender, instance, created, **kwargs):
+    if not created:
+        reindex(instance.recipes.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_recipes(instance.recipes.values_list('id', flat=True))
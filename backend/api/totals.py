@@ -0,0 +1,43 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from recipes.models import RecipeIngredient, ShoppingCart, ShoppingCartTotal
+
+suspended = ContextVar('shopping_cart_totals_suspended', default=False)
+
+
+@contextmanager
+def suspend():
+    """Отключает обновление итогов по сигналам: вызывающий код ведёт их сам.
+
+    Пакетные операции API меняют итоги одним запросом на группу строк,
+    а не по строке на каждый удалённый или изменённый объект.
+    """
+    token = suspended.set(True)
+    try:
+        yield
+    finally:
+        suspended.reset(token)
+
+
+def cart_changed(user_id, recipe_id, servings):
+    """Добавляет в итоги пользователя рецепт на servings порций.
+
+    Отрицательное число порций убирает рецепт из итогов.
+    """
+    if suspended.get() or not servings:
+        return
+    ShoppingCartTotal.objects.add_amounts([user_id], {
+        ingredient_id: amount * servings
+        for ingredient_id, amount in RecipeIngredient.objects.filter(
+            recipe_id=recipe_id).values_list('ingredient_id', 'amount')
+    })
+
+
+def ingredient_changed(recipe_id, ingredient_id, amount):
+    """Меняет количество ингредиента рецепта во всех списках покупок."""
+    if suspended.get() or not amount:
+        return
+    ShoppingCartTotal.objects.add_recipe_amounts(
+        ShoppingCart.objects.filter(recipe_id=recipe_id),
+        {ingredient_id: amount})
@@ -2,6 +2,7 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from api.views.recipes import IngredientViewSet, RecipeViewSet, TagViewSet
+from api.views.metrics import metrics
 from api.views.users import CreateUserViewSet
 
 router = DefaultRouter()
@@ -14,4 +15,5 @@ router.register(r'tags', TagViewSet, basename='tags')
 urlpatterns = [
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
+    path('metrics/', metrics, name='metrics'),
 ]
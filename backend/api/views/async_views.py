@@ -0,0 +1,194 @@
+import asyncio
+from contextlib import ExitStack
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage, Page
+from django.db import close_old_connections, connection
+from django.http import Http404, StreamingHttpResponse
+from rest_framework.response import Response
+
+from api.exporters import EXPORTERS, content_disposition, shopping_cart_rows
+from api.metrics import current
+from api.pagination import KeysetPagination
+from api.views.recipes import IngredientViewSet, RecipeViewSet, TagViewSet
+from foodgram.settings import filename
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscription
+
+
+def call(func, *args, **kwargs):
+    """Вызов в потоке пула с учётом SQL-запросов текущего запроса."""
+    metrics = current.get()
+    try:
+        with ExitStack() as stack:
+            if metrics is not None:
+                stack.enter_context(
+                    connection.execute_wrapper(metrics.execute))
+            return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def run(func, *args, **kwargs):
+    """Выполняет синхронный код в пуле потоков, не блокируя цикл событий."""
+    return sync_to_async(call, thread_sensitive=False)(func, *args, **kwargs)
+
+
+def id_set(queryset, field):
+    return set(queryset.values_list(field, flat=True))
+
+
+def detail_queryset(view, pk):
+    # Выдача поиска без PostgreSQL сверяет pk с базой уже в filter().
+    return view.filter_queryset(view.queryset).filter(pk=pk)
+
+
+async def default_handler(view, request, **kwargs):
+    return await run(getattr(view, view.action), request, **kwargs)
+
+
+async def recipe_list(view, request, **kwargs):
+    """Страница рецептов и отметки пользователя запрашиваются параллельно."""
+    paginator = view.paginator
+    page_size = paginator.get_page_size(request)
+    page_number = request.query_params.get(paginator.page_query_param, 1)
+    try:
+        number = int(page_number)
+    except (TypeError, ValueError):
+        number = 0
+    if (page_size is None or number < 1
+            or KeysetPagination.cursor_query_param in request.query_params):
+        return await default_handler(view, request, **kwargs)
+
+    queryset = await run(view.filter_queryset, view.queryset)
+    django_paginator = paginator.django_paginator_class(queryset, page_size)
+    rows = queryset[(number - 1) * page_size:number * page_size]
+    tasks = [run(getattr, django_paginator, 'count'), run(list, rows)]
+    user = request.user
+    if user.is_authenticated:
+        ids = rows.values('id')
+        tasks += [
+            run(id_set, Favorite.objects.filter(
+                user=user, recipe_id__in=ids), 'recipe_id'),
+            run(id_set, ShoppingCart.objects.filter(
+                user=user, recipe_id__in=ids), 'recipe_id'),
+            run(id_set, Subscription.objects.filter(
+                user=user, author_id__in=rows.values('author_id')),
+                'author_id'),
+        ]
+    _, recipes, *flags = await asyncio.gather(*tasks)
+    try:
+        django_paginator.validate_number(number)
+    except InvalidPage:
+        return await default_handler(view, request, **kwargs)
+
+    favorited, in_cart, subscribed = flags or (set(), set(), set())
+    for recipe in recipes:
+        recipe.is_favorited = recipe.id in favorited
+        recipe.is_in_shopping_cart = recipe.id in in_cart
+        recipe.is_subscribed = recipe.author_id in subscribed
+    paginator.request = request
+    paginator.page = Page(recipes, number, django_paginator)
+    if paginator.template is not None and django_paginator.num_pages > 1:
+        paginator.display_page_controls = True
+    serializer = view.get_serializer(recipes, many=True)
+    data = await run(getattr, serializer, 'data')
+    return paginator.get_paginated_response(data)
+
+
+async def recipe_detail(view, request, **kwargs):
+    """Рецепт и отметки пользователя запрашиваются параллельно."""
+    recipe_queryset = await run(detail_queryset, view,
+                                kwargs[view.lookup_field])
+    tasks = [run(list, recipe_queryset)]
+    user = request.user
+    if user.is_authenticated:
+        tasks += [
+            run(Favorite.objects.filter(
+                user=user, recipe__in=recipe_queryset).exists),
+            run(ShoppingCart.objects.filter(
+                user=user, recipe__in=recipe_queryset).exists),
+            run(Subscription.objects.filter(
+                user=user,
+                author_id__in=recipe_queryset.values('author_id')).exists),
+        ]
+    recipes, *flags = await asyncio.gather(*tasks)
+    if not recipes:
+        raise Http404
+    recipe = recipes[0]
+    view.check_object_permissions(request, recipe)
+    (recipe.is_favorited, recipe.is_in_shopping_cart,
+     recipe.is_subscribed) = flags or (False, False, False)
+    serializer = view.get_serializer(recipe)
+    return Response(await run(getattr, serializer, 'data'))
+
+
+async def download_shopping_cart(view, request, **kwargs):
+    """Список покупок, строки которого прочитаны из базы заранее.
+
+    Django 3.2 перебирает тело StreamingHttpResponse под ASGI синхронно
+    в цикле событий, поэтому база читается в пуле потоков до ответа, и
+    в памяти остаются строки списка; сам файл отдаётся по частям.
+    """
+    renderer = request.accepted_renderer
+    rows = await run(list, shopping_cart_rows(request.user))
+    response = StreamingHttpResponse(
+        EXPORTERS[renderer.format](rows),
+        content_type=f'{renderer.media_type}; charset=utf-8'
+    )
+    response['Content-Disposition'] = content_disposition(
+        filename, renderer.format)
+    return response
+
+
+def async_view(viewset, actions, handler=default_handler, **initkwargs):
+    """Асинхронное чтение через viewset; остальные методы — синхронно."""
+    actions = dict(actions)
+    if 'get' in actions and 'head' not in actions:
+        actions['head'] = actions['get']
+    fallback = viewset.as_view(actions, **initkwargs)
+
+    async def view(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return await sync_to_async(call)(fallback, request,
+                                             *args, **kwargs)
+        self = viewset(**initkwargs)
+        self.action_map = actions
+        for method, action in actions.items():
+            setattr(self, method, getattr(self, action))
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            await run(self.initial, request, *args, **kwargs)
+            response = await handler(self, request, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        return self.finalize_response(request, response, *args, **kwargs)
+
+    view.csrf_exempt = True
+    return view
+
+
+recipe_list_view = async_view(
+    RecipeViewSet, {'get': 'list', 'post': 'create'}, recipe_list,
+    basename='recipes', detail=False)
+recipe_detail_view = async_view(
+    RecipeViewSet,
+    {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update',
+     'delete': 'destroy'},
+    recipe_detail, basename='recipes', detail=True)
+download_shopping_cart_view = async_view(
+    RecipeViewSet, {'get': 'download_shopping_cart'},
+    download_shopping_cart, basename='recipes', detail=False,
+    **RecipeViewSet.download_shopping_cart.kwargs)
+tag_list_view = async_view(TagViewSet, {'get': 'list'},
+                           basename='tags', detail=False)
+tag_detail_view = async_view(TagViewSet, {'get': 'retrieve'},
+                             basename='tags', detail=True)
+ingredient_list_view = async_view(IngredientViewSet, {'get': 'list'},
+                                  basename='ingredients', detail=False)
+ingredient_detail_view = async_view(IngredientViewSet, {'get': 'retrieve'},
+                                    basename='ingredients', detail=True)
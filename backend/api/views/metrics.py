@@ -0,0 +1,32 @@
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from api.metrics import registry
+from foodgram.settings import METRICS_TOKEN
+
+
+def is_staff(request):
+    """Сотрудник, вошедший в админку или передавший токен API."""
+    if request.user.is_staff:
+        return True
+    try:
+        auth = TokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return False
+    return auth is not None and auth[0].is_staff
+
+
+def metrics(request):
+    """Показатели запросов в формате Prometheus.
+
+    Доступны по METRICS_TOKEN и сотрудникам; без токена в настройках
+    остальным в доступе отказано.
+    """
+    token = METRICS_TOKEN and constant_time_compare(
+        request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}')
+    if not token and not is_staff(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(),
+                        content_type='text/plain; version=0.0.4')
@@ -1,55 +1,111 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q, Sum
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAuthenticated
+from rest_framework.permissions import (SAFE_METHODS, AllowAny, IsAdminUser,
+                                        IsAuthenticated)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
-from api.filters import RecipeFilter, IngredientFilter
-from api.pagination import CustomPagination
+from api import totals
+from api.autocomplete import get_ingredient_index
+from api.cache import get_stats
+from api.counters import (RECIPE_COUNTERS, bulk_insert, update_counter,
+                          update_counter_returning)
+from api.exporters import EXPORTERS, content_disposition, shopping_cart_rows
+from api.feed import feed_page
+from api.filters import RecipeFilter
+from api.mixins import ReferenceViewSetMixin
+from api.pantry import pantry_index
+from api.pagination import CustomPagination, FeedPagination
 from api.permissions import IsAuthorOrAdminOnly
-from api.serializers import (IngredientSerializer, TagSerializer,
-                             RecipeSerializer, RecipeCreateSerializer,
-                             RecipeFavoriteSerializer)
-from foodgram.settings import filename
-from recipes.models import (Favorite, Ingredient, RecipeIngredient, Recipe,
-                            ShoppingCart, Tag)
+from api.reference import ingredient_reference, tag_reference
+from api.renderers import CSVRenderer, PlainTextRenderer
+from api.serializers import (IdListSerializer, IngredientSerializer,
+                             PantrySerializer, ServingsSerializer,
+                             TagSerializer, RecipeSerializer,
+                             RecipeCreateSerializer, RecipeFavoriteSerializer)
+from foodgram.settings import (INGREDIENT_SEARCH_LIMIT, RECOMMENDATIONS_LIMIT,
+                               RECOMMENDATIONS_MAX_LIMIT, filename)
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingCartTotal, Tag)
+from users.models import User
+
 
+class IngredientViewSet(ReferenceViewSetMixin,
+                        viewsets.ReadOnlyModelViewSet):
+    """Viewset для просмотра и редактирования ингредиентов.
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
-  """Viewset для просмотра и редактирования ингредиентов."""
+    Список и поиск ?name= отдаются из справочника в памяти процесса,
+    без запросов к базе.
+    """
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny,)
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientFilter
+    reference = ingredient_reference
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name is None:
+            return super().list(request, *args, **kwargs)
+        try:
+            limit = int(request.query_params.get('limit',
+                                                 INGREDIENT_SEARCH_LIMIT))
+        except ValueError:
+            limit = INGREDIENT_SEARCH_LIMIT
+        return Response(get_ingredient_index().search(name, max(limit, 1)))
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
-  """Viewset для просмотра экземпляров Tag."""
+
+class TagViewSet(ReferenceViewSetMixin, viewsets.ReadOnlyModelViewSet):
+    """Viewset для просмотра экземпляров Tag."""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
+    reference = tag_reference
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
-  """Viewset для просмотра и редактирования рецептов."""
+    """Viewset для просмотра и редактирования рецептов."""
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthorOrAdminOnly,)
     pagination_class = CustomPagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        if self.request.method in SAFE_METHODS:
+            return self.queryset.with_user_flags(self.request.user)
+        return self.queryset
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        with totals.suspend():
+            ShoppingCartTotal.objects.subtract_recipe_amounts(
+                instance.shopping_recipe.all(), instance.get_amounts())
+            instance.delete()
+        update_counter(User.objects.filter(id=instance.author_id),
+                       'recipes_count', -1)
+
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeSerializer
         return RecipeCreateSerializer
 
+    @action(
+        detail=False,
+        permission_classes=[IsAdminUser]
+    )
+    def cache_stats(self, request):
+        return Response(get_stats())
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -61,48 +117,247 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return self.delete_from(Favorite, request.user, pk)
 
     @action(
-        detail=True,
+        detail=False,
         methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='favorite',
+        url_name='favorite-batch'
+    )
+    def favorite_batch(self, request):
+        return self.batch(Favorite, request)
+
+    @action(
+        detail=True,
+        methods=['post', 'patch', 'delete'],
         permission_classes=[IsAuthenticated]
     )
     def shopping_cart(self, request, pk):
-        if request.method == 'POST':
-            return self.add_in(ShoppingCart, request.user, pk)
-        return self.delete_from(ShoppingCart, request.user, pk)
+        if request.method == 'DELETE':
+            return self.delete_from(ShoppingCart, request.user, pk)
+        serializer = ServingsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        servings = serializer.validated_data['servings']
+        if request.method == 'PATCH':
+            return self.set_servings(request.user, pk, servings)
+        return self.add_in(ShoppingCart, request.user, pk,
+                           servings=servings)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='shopping_cart',
+        url_name='shopping-cart-batch'
+    )
+    def shopping_cart_batch(self, request):
+        return self.batch(ShoppingCart, request)
+
+    def cart_amounts(self, model, user, recipe_ids):
+        if model is not ShoppingCart:
+            return {}
+        return ShoppingCart.objects.filter(
+            user=user, recipe_id__in=recipe_ids).total_amounts()
 
-    def add_in(self, model, user, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
-        if model.objects.filter(user=user, recipe=recipe).exists():
+    def changed(self, model, user, recipe_ids, delta, amounts=None):
+        update_counter(Recipe.objects.filter(id__in=recipe_ids),
+                       RECIPE_COUNTERS[model], delta)
+        if not amounts:
+            return
+        if delta < 0:
+            ShoppingCartTotal.objects.subtract_amounts([user.id], amounts)
+        else:
+            ShoppingCartTotal.objects.add_amounts([user.id], amounts)
+
+    def add_in(self, model, user, pk, **fields):
+        """Добавление рецепта: счётчик и поля ответа читаются вместе.
+
+        Строка рецепта блокируется счётчиком до вставки, поэтому вставка
+        падает только на повторе, и тогда откатывается и счётчик.
+        """
+        try:
+            pk = int(pk)
+        except ValueError:
+            raise Http404
+        try:
+            with transaction.atomic():
+                recipe = update_counter_returning(
+                    Recipe, pk, RECIPE_COUNTERS[model], 1,
+                    RecipeFavoriteSerializer.source_fields)
+                if recipe is None:
+                    raise Http404
+                model.objects.create(user=user, recipe_id=pk, **fields)
+        except IntegrityError:
             return Response({'errors': 'Рецепт уже добавлен'},
                             status=status.HTTP_400_BAD_REQUEST)
-        model.objects.create(user=user, recipe=recipe)
         serializer = RecipeFavoriteSerializer(recipe)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(dict(serializer.data, **fields),
+                        status=status.HTTP_201_CREATED)
 
+    @transaction.atomic
     def delete_from(self, model, user, pk):
-        obj = get_object_or_404(model, user=user, recipe__id=pk)
-        obj.delete()
+        deleted, _ = model.objects.filter(user=user, recipe_id=pk).delete()
+        if not deleted:
+            raise Http404
+        self.changed(model, user, [pk], -1)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @transaction.atomic
+    def set_servings(self, user, pk, servings):
+        entry = get_object_or_404(
+            ShoppingCart.objects.select_for_update().select_related('recipe'),
+            user=user, recipe_id=pk)
+        if entry.servings != servings:
+            entry.servings = servings
+            entry.save(update_fields=['servings'])
+        serializer = RecipeFavoriteSerializer(entry.recipe)
+        return Response(dict(serializer.data, servings=servings))
+
+    @transaction.atomic
+    def batch(self, model, request):
+        serializer = IdListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        user = request.user
+        found = set(Recipe.objects.filter(
+            id__in=ids).values_list('id', flat=True))
+        present = model.objects.filter(user=user, recipe_id__in=found)
+        if request.method == 'DELETE':
+            present = present.select_for_update()
+        present = set(present.values_list('recipe_id', flat=True))
+        if request.method == 'POST':
+            changed = bulk_insert(
+                [model(user=user, recipe_id=recipe_id)
+                 for recipe_id in sorted(found - present)],
+                'recipe_id')
+            self.changed(model, user, changed, 1,
+                         self.cart_amounts(model, user, changed))
+            statuses = ('created', 'exists')
+        else:
+            changed = present
+            amounts = self.cart_amounts(model, user, changed)
+            with totals.suspend():
+                model.objects.filter(
+                    user=user, recipe_id__in=changed).delete()
+            self.changed(model, user, changed, -1, amounts)
+            statuses = ('deleted', 'not_found')
+        return Response({'results': [
+            {'id': recipe_id,
+             'status': (statuses[0] if recipe_id in changed
+                        else statuses[1] if recipe_id in found
+                        else 'not_found')}
+            for recipe_id in ids
+        ]})
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params.get('limit',
+                                                 RECOMMENDATIONS_LIMIT))
+        except ValueError:
+            limit = RECOMMENDATIONS_LIMIT
+        return min(max(limit, 1), RECOMMENDATIONS_MAX_LIMIT)
+
+    def recommendation_response(self, recipes):
+        serializer = self.get_serializer(recipes, many=True)
+        return Response(serializer.data)
+
+    @action(
+        detail=True,
+        permission_classes=[AllowAny]
+    )
+    def similar(self, request, pk):
+        limit = self.get_limit(request)
+        return self.recommendation_response(
+            self.get_queryset()
+            .filter(neighbour_of__recipe_id=pk)
+            .order_by('-neighbour_of__score', '-id')[:limit])
+
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated]
+    )
+    def recommended(self, request):
+        limit = self.get_limit(request)
+        user = request.user
+        seen = Recipe.objects.filter(
+            Q(favorites_recipe__user=user) | Q(shopping_recipe__user=user)
+        ).values('id')
+        recipes = list(
+            self.get_queryset()
+            .filter(neighbour_of__recipe__in=seen)
+            .exclude(id__in=seen)
+            .annotate(recommendation=Sum('neighbour_of__score'))
+            .order_by('-recommendation', '-id')[:limit])
+        if not recipes:
+            recipes = (self.get_queryset().exclude(id__in=seen)
+                       .order_by('-favorites_count', '-id')[:limit])
+        return self.recommendation_response(recipes)
+
     @action(
         detail=False,
         permission_classes=[IsAuthenticated]
     )
+    def feed(self, request):
+        queryset = self.get_queryset()
+        paginator = FeedPagination()
+        recipes = paginator.paginate_feed(
+            lambda before, limit: feed_page(queryset, request.user.id,
+                                            before, limit),
+            request)
+        serializer = self.get_serializer(recipes, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        permission_classes=[AllowAny]
+    )
+    def pantry(self, request):
+        params = request.query_params
+        data = {'ingredients': [
+            value for values in params.getlist('ingredients')
+            for value in values.split(',') if value
+        ]}
+        for name in ('limit', 'max_missing'):
+            if name in params:
+                data[name] = params[name]
+        serializer = PantrySerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        available = serializer.validated_data['ingredients']
+        matches = pantry_index.match(
+            available, serializer.validated_data['limit'],
+            serializer.validated_data.get('max_missing'))
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in matches])
+        matches = [match for match in matches if match[0] in recipes]
+        missing = defaultdict(list)
+        for recipe_id, ingredient_id in (
+                RecipeIngredient.objects
+                .filter(recipe_id__in=recipes)
+                .exclude(ingredient_id__in=available)
+                .order_by('id').values_list('recipe_id', 'ingredient_id')):
+            missing[recipe_id].append(ingredient_id)
+        data = self.get_serializer(
+            [recipes[recipe_id] for recipe_id, _, _ in matches],
+            many=True).data
+        return Response([
+            dict(item, matched=matched, missing=missing_count,
+                 coverage=round(matched / (matched + missing_count), 3),
+                 missing_ingredients=missing[recipe_id])
+            for item, (recipe_id, matched, missing_count)
+            in zip(data, matches)
+        ])
+
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        renderer_classes=[PlainTextRenderer, CSVRenderer, JSONRenderer]
+    )
     def download_shopping_cart(self, request):
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shopping_recipe__user=request.user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(total=Sum('amount'))
-
-        shopping_cart_list = 'Список покупок:\n'
-        for ingredient in ingredients:
-            shopping_cart_list += (
-                f' {ingredient["ingredient__name"]} - {ingredient["total"]}'
-                f'({ingredient["ingredient__measurement_unit"]})\n')
-
-        response = HttpResponse(shopping_cart_list, content_type='text/plain')
-        response['Content-Disposition'] = (f'attachment;'
-                                           f'filename={filename}')
+        renderer = request.accepted_renderer
+        exporter = EXPORTERS[renderer.format]
+        response = StreamingHttpResponse(
+            exporter(shopping_cart_rows(request.user)),
+            content_type=f'{renderer.media_type}; charset=utf-8'
+        )
+        response['Content-Disposition'] = content_disposition(
+            filename, renderer.format)
         return response
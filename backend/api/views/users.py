@@ -1,3 +1,5 @@
+from django.db import IntegrityError, transaction
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import status
@@ -5,8 +7,12 @@ from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from api.counters import bulk_insert, update_counter
+from api.feed import followers_changed, subscriptions_changed
 from api.pagination import CustomPagination
-from api.serializers import SubscriptionSerializer, CustomUserSerializer
+from api.serializers import (IdListSerializer, SubscriptionSerializer,
+                             CustomUserSerializer, get_recipes_limit)
+from recipes.models import Recipe
 from users.models import Subscription, User
 
 
@@ -15,6 +21,7 @@ class CreateUserViewSet(UserViewSet):
     queryset = User.objects.all()
     serializer_class = CustomUserSerializer
     pagination_class = CustomPagination
+    cursor_ordering = 'id'
 
     @action(
         detail=True,
@@ -25,27 +32,90 @@ class CreateUserViewSet(UserViewSet):
         author = get_object_or_404(User, id=kwargs['id'])
 
         if request.method == 'POST':
+            if author == request.user:
+                return Response({'errors': 'Невозможно подписаться на себя'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            try:
+                with transaction.atomic():
+                    Subscription.objects.create(user=request.user,
+                                                author=author)
+                    update_counter(User.objects.filter(id=author.id),
+                                   'followers_count', 1)
+                    followers_changed([author.id], 1)
+            except IntegrityError:
+                return Response({'errors': 'Вы уже подписаны'},
+                                status=status.HTTP_400_BAD_REQUEST)
             serializer = SubscriptionSerializer(author,
-                                                data=request.data,
                                                 context={'request': request})
-            serializer.is_valid(raise_exception=True)
-            Subscription.objects.create(user=request.user, author=author)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        subscription = get_object_or_404(Subscription,
-                                         user=request.user,
-                                         author=author)
-        subscription.delete()
+        with transaction.atomic():
+            deleted, _ = Subscription.objects.filter(
+                user=request.user, author=author).delete()
+            if not deleted:
+                raise Http404
+            update_counter(User.objects.filter(id=author.id),
+                           'followers_count', -1)
+            followers_changed([author.id], -1)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='subscribe',
+        url_name='subscribe-batch'
+    )
+    @transaction.atomic
+    def subscribe_batch(self, request):
+        serializer = IdListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        user = request.user
+        found = set(User.objects.filter(
+            id__in=ids).exclude(id=user.id).values_list('id', flat=True))
+        present = Subscription.objects.filter(user=user, author_id__in=found)
+        if request.method == 'DELETE':
+            present = present.select_for_update()
+        present = set(present.values_list('author_id', flat=True))
+        if request.method == 'POST':
+            changed = bulk_insert(
+                [Subscription(user=user, author_id=author_id)
+                 for author_id in sorted(found - present)],
+                'author_id')
+            subscriptions_changed([user.id])
+            delta, statuses = 1, ('created', 'exists')
+        else:
+            changed = present
+            Subscription.objects.filter(
+                user=user, author_id__in=changed).delete()
+            delta, statuses = -1, ('deleted', 'not_found')
+        update_counter(User.objects.filter(id__in=changed),
+                       'followers_count', delta)
+        followers_changed(changed, delta)
+        return Response({'results': [
+            {'id': author_id,
+             'status': (statuses[0] if author_id in changed
+                        else statuses[1] if author_id in found
+                        else 'not_found')}
+            for author_id in ids
+        ]})
+
     @action(
         detail=False,
         permission_classes=[IsAuthenticated]
     )
     def subscriptions(self, request):
+        limit = get_recipes_limit(request)
         queryset = User.objects.filter(following__user=request.user)
         pages = self.paginate_queryset(queryset)
-        serializer = SubscriptionSerializer(pages,
+        authors = pages if pages is not None else list(queryset)
+        recipes = Recipe.objects.latest_by_author(authors, limit)
+        for author in authors:
+            author.latest_recipes = recipes[author.id]
+        serializer = SubscriptionSerializer(authors,
                                             many=True,
                                             context={'request': request})
+        if pages is None:
+            return Response(serializer.data)
         return self.get_paginated_response(serializer.data)
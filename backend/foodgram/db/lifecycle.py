@@ -0,0 +1,176 @@
+import threading
+import time
+from collections import deque
+
+from django.db import OperationalError
+
+from api.metrics import registry
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+def check_connection(connection):
+    try:
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+    except Exception:
+        return False
+    return True
+
+
+def close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+class ConnectionPool:
+    """Пул соединений процесса, общий для потоков воркера."""
+
+    def __init__(self, size, timeout, max_lifetime):
+        self.slots = threading.BoundedSemaphore(size)
+        self.idle = deque()
+        self.lock = threading.Lock()
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+
+    def acquire(self):
+        """Занимает место в пуле и возвращает время ожидания."""
+        start = time.perf_counter()
+        if not self.slots.acquire(timeout=self.timeout):
+            raise OperationalError(
+                f'Нет свободного соединения в пуле за {self.timeout} с')
+        return time.perf_counter() - start
+
+    def release(self):
+        self.slots.release()
+
+    def take(self):
+        """Свободное соединение и время его открытия или None."""
+        while True:
+            with self.lock:
+                if not self.idle:
+                    return None
+                created, connection = self.idle.pop()
+            if (self.max_lifetime
+                    and time.monotonic() - created > self.max_lifetime):
+                close_quietly(connection)
+                continue
+            return created, connection
+
+    def give(self, created, connection):
+        with self.lock:
+            self.idle.append((created, connection))
+        self.slots.release()
+
+
+class ConnectionLifecycleMixin:
+    """Проверка постоянных соединений и пул соединений процесса.
+
+    CONN_HEALTH_CHECKS включает проверку соединения перед первым
+    использованием в запросе, POOL_SIZE > 0 — выдачу соединений из пула:
+    в конце запроса соединение возвращается в пул, а не закрывается.
+    """
+    health_check_pending = False
+    pool_created = None
+
+    def get_pool(self):
+        size = self.settings_dict.get('POOL_SIZE') or 0
+        if size <= 0:
+            return None
+        with pools_lock:
+            pool = pools.get(self.alias)
+            if pool is None:
+                pool = pools[self.alias] = ConnectionPool(
+                    size,
+                    self.settings_dict.get('POOL_TIMEOUT', 10),
+                    self.settings_dict.get('POOL_MAX_LIFETIME'),
+                )
+        return pool
+
+    def open_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        registry.inc('db_connections_opened_total', self.alias)
+        return connection
+
+    def get_new_connection(self, conn_params):
+        pool = self.get_pool()
+        if pool is None:
+            return self.open_connection(conn_params)
+        try:
+            wait = pool.acquire()
+        except OperationalError:
+            registry.inc('db_pool_timeouts_total', self.alias)
+            raise
+        registry.observe_wait(self.alias, wait)
+        try:
+            while True:
+                item = pool.take()
+                if item is None:
+                    break
+                created, connection = item
+                if (self.settings_dict.get('CONN_HEALTH_CHECKS')
+                        and not check_connection(connection)):
+                    registry.inc('db_health_check_failures_total',
+                                 self.alias)
+                    close_quietly(connection)
+                    continue
+                registry.inc('db_connections_reused_total', self.alias)
+                self.pool_created = created
+                return connection
+            connection = self.open_connection(conn_params)
+        except Exception:
+            pool.release()
+            raise
+        self.pool_created = time.monotonic()
+        return connection
+
+    def connect(self):
+        self.health_check_pending = False
+        super().connect()
+
+    def ensure_connection(self):
+        if self.connection is not None and self.health_check_pending:
+            self.health_check_pending = False
+            if (self.settings_dict.get('CONN_HEALTH_CHECKS')
+                    and not self.in_atomic_block
+                    and not check_connection(self.connection)):
+                registry.inc('db_health_check_failures_total', self.alias)
+                self.close()
+            else:
+                registry.inc('db_connections_reused_total', self.alias)
+        super().ensure_connection()
+
+    def close_if_unusable_or_obsolete(self):
+        self.health_check_pending = False
+        super().close_if_unusable_or_obsolete()
+        self.health_check_pending = True
+        if (self.connection is not None and not self.in_atomic_block
+                and self.get_pool() is not None):
+            self.close()
+
+    def _close(self):
+        pool = self.get_pool()
+        if pool is None or self.connection is None:
+            return super()._close()
+        connection, created = self.connection, self.pool_created
+        if self.in_atomic_block:
+            close_quietly(connection)
+            pool.release()
+            return
+        try:
+            connection.rollback()
+        except Exception:
+            close_quietly(connection)
+            pool.release()
+            return
+        if self.errors_occurred and not check_connection(connection):
+            close_quietly(connection)
+            pool.release()
+            return
+        pool.give(created, connection)
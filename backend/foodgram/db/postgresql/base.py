@@ -0,0 +1,7 @@
+from django.db.backends.postgresql import base
+
+from foodgram.db.lifecycle import ConnectionLifecycleMixin
+
+
+class DatabaseWrapper(ConnectionLifecycleMixin, base.DatabaseWrapper):
+    """PostgreSQL с проверкой и пулом соединений."""
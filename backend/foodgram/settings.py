@@ -25,12 +25,14 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
+    'sorl.thumbnail',
     'recipes.apps.RecipesConfig',
     'users.apps.UsersConfig',
     'api.apps.ApiConfig'
 ]
 
 MIDDLEWARE = [
+    'api.middleware.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -40,7 +42,7 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'foodgram.urls'
+ROOT_URLCONF = os.getenv('ROOT_URLCONF', default='foodgram.urls')
 
 TEMPLATES = [
     {
@@ -63,17 +65,96 @@ WSGI_APPLICATION = 'foodgram.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+DB_ENGINE = os.getenv('DB_ENGINE', default='foodgram.db.postgresql')
+
+# Постоянные соединения без проверки перед запросом (стандартный движок
+# Django 3.2 не поддерживает CONN_HEALTH_CHECKS) отдают воркерам
+# соединения, оборванные базой, поэтому по умолчанию они только у
+# foodgram.db.postgresql.
 DATABASES = {
     'default': {
-        'ENGINE': os.getenv('DB_ENGINE', default='django.db.backends.postgresql'),
+        'ENGINE': DB_ENGINE,
         'NAME': os.getenv('DB_NAME', default='postgres'),
         'USER': os.getenv('POSTGRES_USER', default='postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.getenv('DB_HOST', default='db'),
         'PORT': os.getenv('DB_PORT', default='5432'),
+        'CONN_MAX_AGE': int(os.getenv(
+            'DB_CONN_MAX_AGE',
+            default=60 if DB_ENGINE == 'foodgram.db.postgresql' else 0)),
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS',
+                                        default='true').lower() == 'true',
+        'POOL_SIZE': int(os.getenv('DB_POOL_SIZE', default=0)),
+        'POOL_TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', default=10)),
+        'POOL_MAX_LIFETIME': int(os.getenv('DB_POOL_MAX_LIFETIME',
+                                           default=3600)),
+    }
+}
+
+# Версии рецептов, журналы индексов и ленты должны быть общими для всех
+# воркеров: кэш в памяти процесса годится только для одного воркера.
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache')
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', default=1))
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
     }
 }
 
+# На каждый рецепт в кэше приходятся ключ версии и ключ данных; при
+# 300 записях по умолчанию LocMemCache вытеснял их уже на второй странице.
+if CACHE_BACKEND == LOCAL_CACHE_BACKENDS[0]:
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', default=100000)),
+    }
+
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', default=3600))
+
+SUBSCRIPTION_RECIPES_LIMIT = int(os.getenv('SUBSCRIPTION_RECIPES_LIMIT',
+                                           default=50))
+
+BATCH_SIZE_LIMIT = int(os.getenv('BATCH_SIZE_LIMIT', default=100))
+
+SHOPPING_CART_MAX_SERVINGS = int(os.getenv('SHOPPING_CART_MAX_SERVINGS',
+                                           default=100))
+
+PAGINATION_COUNT_TIMEOUT = int(os.getenv('PAGINATION_COUNT_TIMEOUT',
+                                         default=60))
+
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT',
+                                        default=50))
+
+REFERENCE_CACHE_TTL = int(os.getenv('REFERENCE_CACHE_TTL', default=60))
+
+# Recipe search
+
+SEARCH_CONFIG = os.getenv('SEARCH_CONFIG', default='russian')
+
+PANTRY_RESULTS_LIMIT = int(os.getenv('PANTRY_RESULTS_LIMIT', default=50))
+
+RECOMMENDATIONS_LIMIT = int(os.getenv('RECOMMENDATIONS_LIMIT', default=10))
+RECOMMENDATIONS_MAX_LIMIT = int(os.getenv('RECOMMENDATIONS_MAX_LIMIT',
+                                          default=50))
+
+# Recipe feed
+
+FEED_FANOUT_THRESHOLD = int(os.getenv('FEED_FANOUT_THRESHOLD', default=1000))
+FEED_CACHE_SIZE = int(os.getenv('FEED_CACHE_SIZE', default=500))
+FEED_CACHE_TIMEOUT = int(os.getenv('FEED_CACHE_TIMEOUT', default=86400))
+
+# Request metrics
+
+METRICS_QUERY_LOG_THRESHOLD = int(os.getenv('METRICS_QUERY_LOG_THRESHOLD',
+                                            default=50))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', default='')
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -126,6 +207,17 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Recipe images
+
+MAX_IMAGE_UPLOAD_SIZE = int(os.getenv('MAX_IMAGE_UPLOAD_SIZE',
+                                      default=10 * 1024 * 1024))
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default=2))
+RECIPE_IMAGE_MAX_SIDE = int(os.getenv('RECIPE_IMAGE_MAX_SIDE', default=1600))
+RECIPE_THUMBNAIL_LIST = os.getenv('RECIPE_THUMBNAIL_LIST', default='480x480')
+RECIPE_THUMBNAIL_DETAIL = os.getenv('RECIPE_THUMBNAIL_DETAIL',
+                                    default='960x960')
+THUMBNAIL_PRESERVE_FORMAT = True
+
 # djoser settings
 
 DJOSER = {
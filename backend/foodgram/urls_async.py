@@ -0,0 +1,20 @@
+from django.urls import path
+
+from api.views.async_views import (download_shopping_cart_view,
+                                   ingredient_detail_view,
+                                   ingredient_list_view, recipe_detail_view,
+                                   recipe_list_view, tag_detail_view,
+                                   tag_list_view)
+from foodgram.urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('api/recipes/', recipe_list_view, name='recipes-list'),
+    path('api/recipes/download_shopping_cart/', download_shopping_cart_view,
+         name='recipes-download-shopping-cart'),
+    path('api/recipes/<int:pk>/', recipe_detail_view, name='recipes-detail'),
+    path('api/tags/', tag_list_view, name='tags-list'),
+    path('api/tags/<int:pk>/', tag_detail_view, name='tags-detail'),
+    path('api/ingredients/', ingredient_list_view, name='ingredients-list'),
+    path('api/ingredients/<int:pk>/', ingredient_detail_view,
+         name='ingredients-detail'),
+] + sync_urlpatterns
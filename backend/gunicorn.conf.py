@@ -0,0 +1,9 @@
+from foodgram.settings import CACHE_BACKEND, LOCAL_CACHE_BACKENDS
+
+
+def on_starting(server):
+    """Не запускает несколько воркеров с кэшем в памяти процесса."""
+    if server.cfg.workers > 1 and CACHE_BACKEND in LOCAL_CACHE_BACKENDS:
+        raise RuntimeError(
+            f'{CACHE_BACKEND} не разделяется между {server.cfg.workers} '
+            'воркерами: задайте общий кэш в CACHE_BACKEND и CACHE_LOCATION')
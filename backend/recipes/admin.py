@@ -2,24 +2,25 @@ from django.contrib import admin
 from django.contrib.admin import display
 
 from .models import (Favorite, Ingredient, RecipeIngredient, Recipe,
-                     ShoppingCart, Tag)
+                     ShoppingCart, ShoppingCartTotal, SimilarityBuild, Tag)
 
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-  """Для модели Recipe создана кастомная админка."""
+    """Для модели Recipe создана кастомная админка."""
     list_display = ('name', 'id', 'author', 'add_in_favorite')
     readonly_fields = ('add_in_favorite',)
     list_filter = ('name', 'author', 'tags',)
 
-    @display(description='Количество в избранном')
+    @display(description='Количество в избранном',
+             ordering='favorites_count')
     def add_in_favorite(self, value):
-        return value.favorites_recipe.count()
+        return value.favorites_count
 
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
-  """Для модели Ingredient создана кастомная админка."""
+    """Для модели Ingredient создана кастомная админка."""
     list_display = ('name', 'measurement_unit')
     list_filter = ('name',)
     search_fields = ('name',)
@@ -27,23 +28,35 @@ class IngredientAdmin(admin.ModelAdmin):
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
-  """Для модели Tag создана кастомная админка."""
+    """Для модели Tag создана кастомная админка."""
     list_display = ('name', 'color', 'slug',)
 
 
 @admin.register(ShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
-  """Для модели ShopingCart создана кастомная админка."""
-    list_display = ('user', 'recipe',)
+    """Для модели ShopingCart создана кастомная админка."""
+    list_display = ('user', 'recipe', 'servings',)
+
+
+@admin.register(ShoppingCartTotal)
+class ShoppingCartTotalAdmin(admin.ModelAdmin):
+    """Для модели ShoppingCartTotal создана кастомная админка."""
+    list_display = ('user', 'ingredient', 'total',)
 
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
-  """Для модели Favorite создана кастомная админка."""
+    """Для модели Favorite создана кастомная админка."""
     list_display = ('user', 'recipe',)
 
 
 @admin.register(RecipeIngredient)
 class RecipeIngredientAdmin(admin.ModelAdmin):
-  """Для модели RecipeIngredient создана кастомная админка."""
+    """Для модели RecipeIngredient создана кастомная админка."""
     list_display = ('recipe', 'ingredient', 'amount',)
+
+
+@admin.register(SimilarityBuild)
+class SimilarityBuildAdmin(admin.ModelAdmin):
+    """Для модели SimilarityBuild создана кастомная админка."""
+    list_display = ('created', 'full', 'recipes', 'duration',)
@@ -0,0 +1,685 @@
+import asyncio
+import base64
+import csv
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import partialmethod
+from urllib.parse import urlencode
+
+import requests
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import AsyncClient, Client, override_settings
+from rest_framework.authtoken.models import Token
+
+from api.exporters import export_txt, shopping_cart_rows
+from api.reference import ingredient_reference
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from users.models import User
+
+QUERIES = re.compile(r'desc="(\d+) queries"')
+CART_RECIPE_SIZE = 500
+CREATE_INGREDIENTS = 5
+CATALOGUE_PREFIX = 'Каталог '
+TAG_RECIPES = 100000
+TAG_COUNT = 10
+
+
+def percentile(values, fraction):
+    """Перцентиль по методу ближайшего ранга."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[max(0, int(round(fraction * len(ordered) + 0.5)) - 1)]
+
+
+def summarize(durations, elapsed, errors=0, queries=()):
+    """Пропускная способность и перцентили по длительностям в секундах."""
+    durations = [duration * 1000 for duration in durations]
+    return {
+        'iterations': len(durations),
+        'errors': errors,
+        'throughput_rps': round(len(durations) / elapsed, 2),
+        'mean_ms': round(sum(durations) / len(durations), 3),
+        'p50_ms': round(percentile(durations, 0.50), 3),
+        'p95_ms': round(percentile(durations, 0.95), 3),
+        'p99_ms': round(percentile(durations, 0.99), 3),
+        'queries': percentile(list(queries), 0.50),
+    }
+
+
+def process_tree(pid):
+    """PID процесса и всех его потомков (Linux, /proc)."""
+    parents = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat', encoding='utf-8') as file:
+                stat = file.read()
+        except OSError:
+            continue
+        parents.setdefault(int(stat.rsplit(')', 1)[1].split()[1]),
+                           []).append(int(name))
+    tree, queue = [], [pid]
+    while queue:
+        current = queue.pop()
+        tree.append(current)
+        queue.extend(parents.get(current, []))
+    return tree
+
+
+def server_memory(pid):
+    """Суммарный RSS сервера с воркерами в мегабайтах."""
+    total = 0
+    for current in process_tree(pid):
+        try:
+            with open(f'/proc/{current}/status', encoding='utf-8') as file:
+                for line in file:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        except OSError:
+            continue
+    return round(total / 1024, 1)
+
+
+class ServerClient:
+    """Запросы к запущенному серверу с интерфейсом тестового клиента."""
+
+    def __init__(self, url, authorization):
+        self.url = url.rstrip('/')
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = authorization
+
+    def request(self, method, path, data=None, content_type=None):
+        response = self.session.request(
+            method, self.url + path, data=data,
+            headers={'Content-Type': content_type} if content_type else {})
+        response.streaming = False
+        response.get = response.headers.get
+        return response
+
+    get = partialmethod(request, 'GET')
+    post = partialmethod(request, 'POST')
+    patch = partialmethod(request, 'PATCH')
+    delete = partialmethod(request, 'DELETE')
+
+
+def legacy_shopping_cart(user):
+    """Прежняя выгрузка: весь список собирается в строку в памяти."""
+    ingredients = RecipeIngredient.objects.filter(
+        recipe__shopping_recipe__user=user
+    ).values(
+        'ingredient__name',
+        'ingredient__measurement_unit'
+    ).annotate(total=Sum('amount'))
+
+    shopping_cart_list = 'Список покупок:\n'
+    for ingredient in ingredients:
+        shopping_cart_list += (
+            f' {ingredient["ingredient__name"]} - {ingredient["total"]}'
+            f'({ingredient["ingredient__measurement_unit"]})\n')
+    return HttpResponse(shopping_cart_list, content_type='text/plain')
+
+
+def streaming_shopping_cart(user):
+    return StreamingHttpResponse(export_txt(shopping_cart_rows(user)),
+                                 content_type='text/plain')
+
+
+class Command(BaseCommand):
+    """Нагрузочный прогон основных эндпоинтов через тестовый клиент."""
+    help = ('Замеряет пропускную способность и p50/p95/p99 основных '
+            'эндпоинтов, сохраняет результат в JSON и сравнивает с базовым')
+    scenarios = ('recipes-list', 'recipes-list-filtered', 'recipes-detail',
+                 'recipes-create', 'recipes-update', 'download-shopping-cart',
+                 'users-subscriptions', 'ingredients-search',
+                 'recipes-search', 'recipes-pantry', 'recipes-feed')
+    # Наборы замеров: запускаются только явно через --scenario.
+    suites = {
+        'recipes-create-sizes': 'run_creates',
+        'recipes-offsets': 'run_offsets',
+        'load-ingredients': 'run_imports',
+        'recipes-tags': 'run_tags',
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--scenario', action='append',
+                            choices=self.scenarios + tuple(self.suites),
+                            help='Запустить только указанные сценарии; '
+                                 'наборы замеров (' + ', '.join(self.suites)
+                                 + ') запускаются только так')
+        parser.add_argument('--user', type=int,
+                            help='id пользователя, от имени которого '
+                                 'выполняются запросы')
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Число одновременных запросов')
+        parser.add_argument('--asgi', action='store_true',
+                            help='Прогон через ASGI с асинхронными '
+                                 'представлениями чтения')
+        parser.add_argument('--server',
+                            help='Адрес запущенного сервера, например '
+                                 'http://127.0.0.1:8000: запросы идут по HTTP')
+        parser.add_argument('--server-pid', type=int,
+                            help='PID главного процесса сервера: к '
+                                 'результатам добавляется память воркеров')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--cart-lines', type=int, nargs='+', default=[],
+                            help='Сравнить потоковую и прежнюю выгрузку '
+                                 'списка покупок с таким числом строк')
+        parser.add_argument('--create-ingredients', type=int, nargs='+',
+                            default=[1, 10, 40, 100],
+                            help='Число ингредиентов рецепта для '
+                                 'recipes-create-sizes')
+        parser.add_argument('--offsets', type=int, nargs='+',
+                            default=[0, 10000, 1000000],
+                            help='Смещения в списке рецептов для '
+                                 'recipes-offsets')
+        parser.add_argument('--catalogue-rows', type=int, default=1000000,
+                            help='Строк синтетического каталога для '
+                                 'load-ingredients')
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+        parser.add_argument('--baseline',
+                            help='JSON с результатами для сравнения')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Допустимый рост p95 относительно базового')
+
+    def get_user(self, user_id):
+        if user_id is not None:
+            return User.objects.get(id=user_id)
+        user = (User.objects.filter(shopping_user__isnull=False)
+                .order_by('id').first() or User.objects.order_by('id').first())
+        if user is None:
+            raise CommandError('Нет пользователей: запустите generate_data')
+        return user
+
+    def prepare(self, user):
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True)[:1000])
+        if not recipe_ids:
+            raise CommandError('Нет рецептов: запустите generate_data')
+        self.recipe_ids = recipe_ids
+        self.tags = list(Tag.objects.values_list('id', 'slug'))
+        self.ingredients = list(
+            Ingredient.objects.values_list('id', 'name')[:1000])
+        self.created = []
+        self.create_size = CREATE_INGREDIENTS
+        self.keystrokes = deque()
+        if not ShoppingCart.objects.filter(user=user).exists():
+            self.get_client().post(
+                f'/api/recipes/{recipe_ids[0]}/shopping_cart/')
+
+    def recipe_payload(self):
+        return {
+            'name': 'Тестовый рецепт',
+            'text': 'Описание тестового рецепта',
+            'cooking_time': self.random.randint(5, 120),
+            'tags': [tag_id for tag_id, _ in self.tags[:2]],
+            'ingredients': [
+                {'id': ingredient_id, 'amount': self.random.randint(1, 500)}
+                for ingredient_id, _ in self.random.sample(
+                    self.ingredients,
+                    min(self.create_size, len(self.ingredients)))
+            ],
+        }
+
+    def keystroke(self):
+        """Очередная строка поиска: название набирается по букве."""
+        try:
+            return self.keystrokes.popleft()
+        except IndexError:
+            name = self.random.choice(self.ingredients)[1]
+            self.keystrokes.extend(
+                name[:length] for length in range(2, len(name) + 1))
+            return name[:1]
+
+    def spec(self, scenario):
+        """Метод, путь со строкой запроса и тело запроса сценария."""
+        if scenario == 'recipes-list':
+            return 'get', '/api/recipes/', {
+                'page': self.random.randint(1, 10), 'limit': 10}, None
+        if scenario == 'recipes-list-filtered':
+            params = {'limit': 10, 'is_favorited': 1}
+            if self.tags:
+                params['tags'] = self.random.choice(self.tags)[1]
+            return 'get', '/api/recipes/', params, None
+        if scenario == 'recipes-detail':
+            recipe_id = self.random.choice(self.recipe_ids)
+            return 'get', f'/api/recipes/{recipe_id}/', None, None
+        if scenario == 'recipes-create':
+            return 'post', '/api/recipes/', None, self.recipe_payload()
+        if scenario == 'recipes-update':
+            return ('patch', f'/api/recipes/{self.created[0]}/', None,
+                    self.recipe_payload())
+        if scenario == 'recipes-page':
+            return 'get', '/api/recipes/', {
+                'page': self.offset // 10 + 1, 'limit': 10}, None
+        if scenario == 'recipes-tags':
+            return 'get', '/api/recipes/', {**self.tag_params,
+                                            'limit': 10}, None
+        if scenario == 'recipes-cursor':
+            return 'get', '/api/recipes/', {
+                'cursor': self.cursor, 'limit': 10}, None
+        if scenario == 'download-shopping-cart':
+            return 'get', '/api/recipes/download_shopping_cart/', None, None
+        if scenario == 'users-subscriptions':
+            return 'get', '/api/users/subscriptions/', {
+                'limit': 10, 'recipes_limit': 3}, None
+        if scenario == 'ingredients-search':
+            return 'get', '/api/ingredients/', {
+                'name': self.keystroke()}, None
+        if scenario == 'recipes-search':
+            words = self.random.choice(self.ingredients)[1].split()
+            return 'get', '/api/recipes/', {
+                'search': f'{words[0][:4]}*', 'limit': 10}, None
+        if scenario == 'recipes-feed':
+            return 'get', '/api/recipes/feed/', {'limit': 10}, None
+        if scenario == 'recipes-pantry':
+            ingredients = self.random.sample(
+                self.ingredients, min(10, len(self.ingredients)))
+            return 'get', '/api/recipes/pantry/', {
+                'ingredients': ','.join(
+                    str(ingredient_id) for ingredient_id, _ in ingredients),
+                'limit': 10}, None
+        raise CommandError(f'Неизвестный сценарий {scenario}')
+
+    def request_args(self, scenario):
+        method, path, params, body = self.spec(scenario)
+        if params:
+            path = f'{path}?{urlencode(params, doseq=True)}'
+        if body is None:
+            return method, (path,), {}
+        return method, (path, json.dumps(body)), {
+            'content_type': 'application/json'}
+
+    def finish(self, scenario, response):
+        if response.streaming:
+            b''.join(response.streaming_content)
+        if scenario == 'recipes-create' and response.status_code == 201:
+            self.created.append(response.json()['id'])
+        return response
+
+    def get_client(self):
+        client = getattr(self.local, 'client', None)
+        if client is None and self.server:
+            client = self.local.client = ServerClient(
+                self.server, self.authorization)
+        elif client is None:
+            client = self.local.client = Client(
+                HTTP_AUTHORIZATION=self.authorization)
+        return client
+
+    def request(self, scenario):
+        method, args, kwargs = self.request_args(scenario)
+        start = time.perf_counter()
+        response = getattr(self.get_client(), method)(*args, **kwargs)
+        self.finish(scenario, response)
+        return time.perf_counter() - start, response
+
+    async def arequest(self, scenario, semaphore):
+        method, args, kwargs = self.request_args(scenario)
+        async with semaphore:
+            start = time.perf_counter()
+            response = await getattr(self.async_client, method)(
+                *args, authorization=self.authorization, **kwargs)
+            self.finish(scenario, response)
+            return time.perf_counter() - start, response
+
+    def perform(self, scenario, count, concurrency, asgi):
+        if asgi:
+            async def requests():
+                semaphore = asyncio.Semaphore(concurrency)
+                return await asyncio.gather(*(
+                    self.arequest(scenario, semaphore)
+                    for _ in range(count)))
+            return asyncio.run(requests())
+        if concurrency == 1:
+            return [self.request(scenario) for _ in range(count)]
+        with ThreadPoolExecutor(concurrency) as executor:
+            return list(executor.map(self.request, [scenario] * count))
+
+    def run(self, scenario, iterations, warmup, concurrency=1, asgi=False):
+        if scenario == 'recipes-update' and not self.created:
+            self.perform('recipes-create', 1, 1, asgi)
+        self.perform(scenario, warmup, concurrency, asgi)
+        durations, queries, errors = [], [], 0
+        started = time.perf_counter()
+        results = self.perform(scenario, iterations, concurrency, asgi)
+        elapsed = time.perf_counter() - started
+        for duration, response in results:
+            durations.append(duration)
+            errors += response.status_code >= 400
+            match = QUERIES.search(response.get('Server-Timing', ''))
+            if match:
+                queries.append(int(match.group(1)))
+        return summarize(durations, elapsed, errors, queries)
+
+    def run_creates(self, options):
+        """Создание рецепта в зависимости от числа ингредиентов."""
+        results = {}
+        for size in sorted(set(options['create_ingredients'])):
+            if size > len(self.ingredients):
+                raise CommandError(
+                    f'В базе меньше {size} ингредиентов')
+            self.create_size = size
+            results[f'recipes-create[{size}]'] = self.run(
+                'recipes-create', options['iterations'], options['warmup'])
+        self.create_size = CREATE_INGREDIENTS
+        return results
+
+    def run_offsets(self, options):
+        """Страница списка рецептов на смещении: OFFSET против курсора."""
+        results = {}
+        recipe_ids = Recipe.objects.order_by('-id').values_list(
+            'id', flat=True)
+        for offset in sorted(set(options['offsets'])):
+            self.offset = offset
+            self.cursor = ''
+            if offset:
+                previous = recipe_ids[offset - 1:offset].first()
+                if previous is None:
+                    raise CommandError(
+                        f'В базе меньше {offset} рецептов: запустите '
+                        f'generate_data --recipes {offset + 10}')
+                self.cursor = base64.b64encode(
+                    urlencode({'p': previous}).encode()).decode()
+            for scenario in ('recipes-page', 'recipes-cursor'):
+                results[f'{scenario}[{offset}]'] = self.run(
+                    scenario, options['iterations'], options['warmup'])
+        return results
+
+    def run_tags(self, options):
+        """Фильтр по тегам отдельно и вместе с остальными фильтрами.
+
+        Каждый вариант сначала проверяется: рецепт попадает в выдачу
+        один раз, а count совпадает с числом рецептов с этими тегами.
+        """
+        enough = Recipe.objects.order_by('id').values_list(
+            'id', flat=True)[TAG_RECIPES - 1:TAG_RECIPES].first()
+        if len(self.tags) < TAG_COUNT or enough is None:
+            raise CommandError(
+                f'Нужно не меньше {TAG_RECIPES} рецептов и {TAG_COUNT} '
+                f'тегов: запустите generate_data --recipes {TAG_RECIPES} '
+                f'--tags {TAG_COUNT}')
+        slugs = [slug for _, slug in self.tags[:TAG_COUNT]]
+        author = Recipe.objects.filter(id=self.recipe_ids[0]).values_list(
+            'author_id', flat=True).get()
+        variants = {
+            'recipes-tags[1]': {'tags': slugs[:1]},
+            'recipes-tags[3]': {'tags': slugs[:3]},
+            f'recipes-tags[{TAG_COUNT}]': {'tags': slugs},
+            'recipes-tags[3]+author': {'tags': slugs[:3], 'author': author},
+            'recipes-tags[3]+favorited': {'tags': slugs[:3],
+                                          'is_favorited': 1},
+            'recipes-tags[3]+cart': {'tags': slugs[:3],
+                                     'is_in_shopping_cart': 1},
+        }
+        results = {}
+        for name, params in variants.items():
+            self.tag_params = params
+            response = self.get_client().get(
+                f'/api/recipes/?{urlencode({**params, "limit": 100}, True)}')
+            data = response.json()
+            ids = [recipe['id'] for recipe in data['results']]
+            if len(ids) != len(set(ids)):
+                raise CommandError(f'{name}: рецепты повторяются в выдаче')
+            if set(params) == {'tags'} and data['count'] != (
+                    Recipe.objects.filter(tags__slug__in=params['tags'])
+                    .distinct().count()):
+                raise CommandError(f'{name}: count не совпадает с базой')
+            results[name] = self.run('recipes-tags', options['iterations'],
+                                     options['warmup'])
+        return results
+
+    def create_cart(self, lines):
+        """Пользователь, в списке покупок которого lines ингредиентов."""
+        user = User.objects.create(username=f'benchmark-cart-{lines}',
+                                   email=f'benchmark-cart-{lines}@example.com')
+        ingredients = [
+            Ingredient(name=f'Ингредиент {lines}-{number:06d}',
+                       measurement_unit='г')
+            for number in range(lines)
+        ]
+        Ingredient.objects.bulk_create(ingredients, batch_size=1000)
+        ingredient_ids = list(Ingredient.objects.filter(
+            name__startswith=f'Ингредиент {lines}-'
+        ).values_list('id', flat=True))
+        for start in range(0, lines, CART_RECIPE_SIZE):
+            recipe = Recipe.objects.create(
+                name='Рецепт для выгрузки', text='Описание', cooking_time=1,
+                author=user, image='recipes/benchmark.png')
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(recipe=recipe, ingredient_id=ingredient_id,
+                                 amount=1)
+                for ingredient_id in ingredient_ids[
+                    start:start + CART_RECIPE_SIZE]
+            ], batch_size=1000)
+            # Итоги корзины добавляет сигнал создания записи списка покупок.
+            ShoppingCart.objects.create(user=user, recipe=recipe)
+        return user
+
+    def measure_export(self, export, user, iterations):
+        """Время до первого фрагмента, полное время и пик памяти."""
+        first, durations = [], []
+        started = time.perf_counter()
+        for _ in range(iterations):
+            start = time.perf_counter()
+            response = export(user)
+            chunks = iter(response.streaming_content if response.streaming
+                          else [response.content])
+            next(chunks)
+            first.append(time.perf_counter() - start)
+            for _ in chunks:
+                pass
+            durations.append(time.perf_counter() - start)
+        stats = summarize(durations, time.perf_counter() - started)
+        tracemalloc.start()
+        try:
+            response = export(user)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        stats['ttfb_p50_ms'] = round(
+            percentile([value * 1000 for value in first], 0.50), 3)
+        stats['peak_memory_kb'] = round(peak / 1024)
+        return stats
+
+    def run_exports(self, sizes, iterations):
+        """Сравнивает выгрузки; корзины создаются в откатываемой транзакции."""
+        results = {}
+        with transaction.atomic():
+            for lines in sorted(set(sizes)):
+                user = self.create_cart(lines)
+                for name, export in (
+                        ('download-shopping-cart', streaming_shopping_cart),
+                        ('download-shopping-cart-legacy',
+                         legacy_shopping_cart)):
+                    results[f'{name}[{lines}]'] = self.measure_export(
+                        export, user, iterations)
+            transaction.set_rollback(True)
+        return results
+
+    def write_catalogue(self, rows):
+        """Временный CSV-файл синтетического каталога."""
+        file = tempfile.NamedTemporaryFile(
+            'w', suffix='.csv', encoding='utf-8', newline='', delete=False)
+        with file:
+            writer = csv.writer(file)
+            for number in range(rows):
+                writer.writerow((f'{CATALOGUE_PREFIX}{number:07d}',
+                                 ('г', 'мл', 'шт.')[number % 3]))
+        return file.name
+
+    def delete_catalogue(self):
+        """Удаляет синтетический каталог одним запросом, минуя сигналы."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {Ingredient._meta.db_table} WHERE name LIKE %s',
+                [CATALOGUE_PREFIX + '%'])
+        ingredient_reference.bump()
+
+    def import_catalogue(self, path, rows, *args):
+        start = time.perf_counter()
+        call_command('load_ingredients', path, *args, stdout=io.StringIO())
+        elapsed = time.perf_counter() - start
+        return {'rows': rows, 'seconds': round(elapsed, 3),
+                'rows_per_second': round(rows / elapsed)}
+
+    def run_imports(self, options):
+        """Первая и повторная загрузка каталога через COPY и bulk_create."""
+        rows = options['catalogue_rows']
+        if Ingredient.objects.filter(
+                name__startswith=CATALOGUE_PREFIX).exists():
+            raise CommandError(
+                f'В базе уже есть ингредиенты «{CATALOGUE_PREFIX}…»')
+        modes = [('bulk', ['--no-copy'])]
+        if connection.vendor == 'postgresql':
+            modes.insert(0, ('copy', []))
+        path = self.write_catalogue(rows)
+        results = {}
+        try:
+            for mode, args in modes:
+                try:
+                    for run in ('new', 'repeat'):
+                        results[f'load-ingredients-{mode}[{run}]'] = (
+                            self.import_catalogue(path, rows, *args))
+                finally:
+                    self.delete_catalogue()
+        finally:
+            os.remove(path)
+        return results
+
+    def report(self, scenario, stats):
+        if 'rows_per_second' in stats:
+            self.stdout.write(f'{scenario:<32} {stats["rows"]} строк  '
+                              f'{stats["seconds"]} с  '
+                              f'{stats["rows_per_second"]} строк/с')
+            return
+        line = (f'{scenario:<24} {stats["throughput_rps"]:>8} rps  '
+                f'p50 {stats["p50_ms"]:>8} мс  '
+                f'p95 {stats["p95_ms"]:>8} мс  '
+                f'p99 {stats["p99_ms"]:>8} мс  '
+                f'запросов {stats["queries"]}  ошибок {stats["errors"]}')
+        if 'server_rss_mb' in stats:
+            line += f'  память сервера {stats["server_rss_mb"]} МБ'
+        if 'ttfb_p50_ms' in stats:
+            line += (f'  первый байт {stats["ttfb_p50_ms"]} мс  '
+                     f'память {stats["peak_memory_kb"]} КБ')
+        self.stdout.write(line)
+
+    def cleanup(self):
+        for recipe_id in self.created:
+            self.get_client().delete(f'/api/recipes/{recipe_id}/')
+
+    def compare(self, results, baseline, tolerance):
+        regressions = []
+        for scenario, current in results.items():
+            previous = baseline.get('scenarios', {}).get(scenario)
+            if previous is None:
+                continue
+            if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+                regressions.append(
+                    f'{scenario}: p95 {previous["p95_ms"]} -> '
+                    f'{current["p95_ms"]} мс')
+            if (current['queries'] or 0) > (previous['queries'] or 0):
+                regressions.append(
+                    f'{scenario}: запросов {previous["queries"]} -> '
+                    f'{current["queries"]}')
+            if current['errors'] > previous['errors']:
+                regressions.append(
+                    f'{scenario}: ошибок {previous["errors"]} -> '
+                    f'{current["errors"]}')
+        return regressions
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1 or options['concurrency'] < 1:
+            raise CommandError(
+                '--iterations и --concurrency должны быть больше нуля')
+        if options['server'] and options['asgi']:
+            raise CommandError('--asgi задаёт режим тестового клиента; '
+                               'с --server режим определяет сам сервер')
+        self.server = options['server']
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as file:
+                baseline = json.load(file)
+        self.random = random.Random(options['seed'])
+        user = self.get_user(options['user'])
+        token, _ = Token.objects.get_or_create(user=user)
+        self.authorization = f'Token {token.key}'
+        self.local = threading.local()
+        self.async_client = AsyncClient()
+        self.prepare(user)
+
+        results = {}
+        imports = {}
+        urlconf = ('foodgram.urls_async' if options['asgi']
+                   else settings.ROOT_URLCONF)
+        try:
+            for scenario in options['scenario'] or self.scenarios:
+                if scenario in self.suites:
+                    suite = getattr(self, self.suites[scenario])(options)
+                    for name, stats in suite.items():
+                        self.report(name, stats)
+                    (imports if scenario == 'load-ingredients'
+                     else results).update(suite)
+                    continue
+                with override_settings(ROOT_URLCONF=urlconf):
+                    results[scenario] = stats = self.run(
+                        scenario, options['iterations'], options['warmup'],
+                        options['concurrency'], options['asgi'])
+                if options['server_pid']:
+                    stats['server_rss_mb'] = server_memory(
+                        options['server_pid'])
+                self.report(scenario, stats)
+            if options['cart_lines']:
+                exports = self.run_exports(options['cart_lines'],
+                                           options['iterations'])
+                for scenario, stats in exports.items():
+                    self.report(scenario, stats)
+                results.update(exports)
+        finally:
+            self.cleanup()
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({
+                    'created': datetime.now(timezone.utc).isoformat(),
+                    'database': connection.vendor,
+                    'mode': ('http' if self.server
+                             else 'asgi' if options['asgi'] else 'wsgi'),
+                    'server': self.server,
+                    'concurrency': options['concurrency'],
+                    'user': user.id,
+                    'recipes': Recipe.objects.count(),
+                    'scenarios': results,
+                    'imports': imports,
+                }, file, ensure_ascii=False, indent=2)
+        if baseline is not None:
+            regressions = self.compare(results, baseline,
+                                       options['tolerance'])
+            if regressions:
+                raise CommandError('Регрессии относительно базового '
+                                   'прогона:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS(
+                'Регрессий относительно базового прогона нет'))
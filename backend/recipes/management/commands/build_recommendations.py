@@ -0,0 +1,191 @@
+import resource
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+
+from recipes.models import (Favorite, RecipeSimilarity, ShoppingCart,
+                            SimilarityBuild)
+
+INTERACTIONS = 'recommendation_interactions'
+COUNTS = 'recommendation_counts'
+AFFECTED = 'recommendation_affected'
+LAST_ID = 2 ** 63 - 1
+
+INTERACTIONS_SQL = f'''
+CREATE TEMPORARY TABLE {INTERACTIONS} AS
+SELECT user_id, recipe_id FROM (
+    SELECT user_id, recipe_id, ROW_NUMBER() OVER (
+        PARTITION BY user_id ORDER BY recipe_id DESC) AS position
+    FROM (SELECT user_id, recipe_id FROM {{favorite}} WHERE id <= %s
+          UNION
+          SELECT user_id, recipe_id FROM {{cart}} WHERE id <= %s) pairs
+) ranked
+WHERE position <= %s
+'''
+
+COUNTS_SQL = f'''
+CREATE TEMPORARY TABLE {COUNTS} AS
+SELECT recipe_id, COUNT(*) AS total FROM {INTERACTIONS} GROUP BY recipe_id
+'''
+
+AFFECTED_SQL = f'''
+CREATE TEMPORARY TABLE {AFFECTED} AS
+SELECT DISTINCT recipe_id FROM {INTERACTIONS}
+WHERE user_id IN (
+    SELECT user_id FROM {{favorite}} WHERE id > %s AND id <= %s
+    UNION
+    SELECT user_id FROM {{cart}} WHERE id > %s AND id <= %s)
+'''
+
+DELETE_SQL = '''
+DELETE FROM {similarity}
+WHERE recipe_id >= %s AND recipe_id < %s {affected}
+'''
+
+# Разреженное произведение матрицы «пользователь × рецепт» на себя
+# по диапазону рецептов: совместные добавления, косинусная близость
+# и top-k соседей на рецепт.
+INSERT_SQL = f'''
+INSERT INTO {{similarity}} (recipe_id, similar_id, score)
+SELECT recipe_id, similar_id, score FROM (
+    SELECT pairs.recipe_id, pairs.similar_id, pairs.score,
+           ROW_NUMBER() OVER (
+               PARTITION BY pairs.recipe_id
+               ORDER BY pairs.score DESC, pairs.similar_id DESC
+           ) AS position
+    FROM (
+        SELECT together.recipe_id, together.similar_id,
+               together.total / SQRT(1.0 * source.total * target.total)
+                   AS score
+        FROM (
+            SELECT a.recipe_id, b.recipe_id AS similar_id,
+                   COUNT(*) AS total
+            FROM {INTERACTIONS} a
+            JOIN {INTERACTIONS} b
+              ON b.user_id = a.user_id AND b.recipe_id <> a.recipe_id
+            WHERE a.recipe_id >= %s AND a.recipe_id < %s {{affected}}
+            GROUP BY a.recipe_id, b.recipe_id
+            HAVING COUNT(*) >= %s
+        ) together
+        JOIN {COUNTS} source ON source.recipe_id = together.recipe_id
+        JOIN {COUNTS} target ON target.recipe_id = together.similar_id
+    ) pairs
+) ranked
+WHERE position <= %s
+'''
+
+
+class Command(BaseCommand):
+    """Расчёт похожих рецептов по избранному и спискам покупок."""
+    help = ('Считает косинусную близость рецептов по совместным '
+            'добавлениям и сохраняет top-k соседей каждого рецепта')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=20)
+        parser.add_argument('--min-support', type=int, default=2,
+                            help='Минимум пользователей, добавивших '
+                                 'оба рецепта')
+        parser.add_argument('--user-limit', type=int, default=500,
+                            help='Учитывать не больше стольких последних '
+                                 'рецептов пользователя')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Рецептов в одном проходе')
+        parser.add_argument('--incremental', action='store_true',
+                            help='Пересчитать только рецепты '
+                                 'пользователей с новыми добавлениями')
+
+    def drop_tables(self, cursor):
+        for table in (AFFECTED, COUNTS, INTERACTIONS):
+            cursor.execute(f'DROP TABLE IF EXISTS {table}')
+
+    def prepare(self, cursor, last_favorite, last_cart, previous, options):
+        tables = {'favorite': Favorite._meta.db_table,
+                  'cart': ShoppingCart._meta.db_table}
+        cursor.execute(INTERACTIONS_SQL.format(**tables),
+                       [last_favorite, last_cart, options['user_limit']])
+        cursor.execute(f'CREATE INDEX {INTERACTIONS}_user '
+                       f'ON {INTERACTIONS} (user_id, recipe_id)')
+        cursor.execute(f'CREATE INDEX {INTERACTIONS}_recipe '
+                       f'ON {INTERACTIONS} (recipe_id, user_id)')
+        cursor.execute(COUNTS_SQL)
+        cursor.execute(f'CREATE INDEX {COUNTS}_recipe '
+                       f'ON {COUNTS} (recipe_id)')
+        if previous is None:
+            cursor.execute(f'SELECT DISTINCT recipe_id FROM {INTERACTIONS} '
+                           f'ORDER BY recipe_id')
+        else:
+            cursor.execute(AFFECTED_SQL.format(**tables), [
+                previous.last_favorite_id, last_favorite,
+                previous.last_cart_id, last_cart])
+            cursor.execute(f'SELECT recipe_id FROM {AFFECTED} '
+                           f'ORDER BY recipe_id')
+        return [row[0] for row in cursor.fetchall()]
+
+    def ranges(self, recipe_ids, chunk_size, full):
+        """Диапазоны id; при полной сборке покрывают все рецепты."""
+        starts = recipe_ids[::chunk_size]
+        for index, start in enumerate(starts):
+            end = (starts[index + 1] if index + 1 < len(starts)
+                   else LAST_ID)
+            yield (0 if full and not index else start), end
+
+    def build(self, cursor, recipe_ids, full, options):
+        def affected(column):
+            if full:
+                return ''
+            return f'AND {column} IN (SELECT recipe_id FROM {AFFECTED})'
+
+        table = RecipeSimilarity._meta.db_table
+        delete_sql = DELETE_SQL.format(similarity=table,
+                                       affected=affected('recipe_id'))
+        insert_sql = INSERT_SQL.format(similarity=table,
+                                       affected=affected('a.recipe_id'))
+        ranges = list(self.ranges(recipe_ids, options['chunk_size'], full))
+        if full and not ranges:
+            ranges = [(0, LAST_ID)]
+        for start, end in ranges:
+            with transaction.atomic():
+                cursor.execute(delete_sql, [start, end])
+                cursor.execute(insert_sql, [start, end,
+                                            options['min_support'],
+                                            options['top_k']])
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        previous = (SimilarityBuild.objects.first()
+                    if options['incremental'] else None)
+        full = previous is None
+        if options['incremental'] and full:
+            self.stdout.write('Предыдущей сборки нет, считаю полностью')
+        last_favorite = Favorite.objects.aggregate(
+            last=Max('id'))['last'] or 0
+        last_cart = ShoppingCart.objects.aggregate(
+            last=Max('id'))['last'] or 0
+
+        with connection.cursor() as cursor:
+            self.drop_tables(cursor)
+            try:
+                recipe_ids = self.prepare(cursor, last_favorite, last_cart,
+                                          previous, options)
+                cursor.execute(f'SELECT COUNT(*) FROM {INTERACTIONS}')
+                interactions = cursor.fetchone()[0]
+                self.build(cursor, recipe_ids, full, options)
+            finally:
+                self.drop_tables(cursor)
+
+        build = SimilarityBuild.objects.create(
+            full=full,
+            last_favorite_id=last_favorite,
+            last_cart_id=last_cart,
+            recipes=len(recipe_ids),
+            duration=time.perf_counter() - start,
+        )
+        memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Полная" if full else "Инкрементальная"} сборка: '
+            f'взаимодействий {interactions}, пересчитано рецептов '
+            f'{build.recipes}, соседей {RecipeSimilarity.objects.count()} '
+            f'за {build.duration:.1f} с, пик памяти процесса '
+            f'{memory:.0f} МБ'))
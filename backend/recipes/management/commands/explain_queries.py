@@ -0,0 +1,78 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+
+from api.filters import RecipeFilter
+from api.reference import tag_reference
+from recipes.models import Ingredient, Recipe, ShoppingCartTotal
+from users.models import User
+
+SEQ_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+class Command(BaseCommand):
+    """Проверка планов основных запросов API через EXPLAIN."""
+    help = ('Выполняет EXPLAIN для запросов основных списков и завершается '
+            'с ошибкой при последовательном сканировании больших таблиц')
+    checked_tables = {
+        Recipe._meta.db_table,
+        Recipe.favorites_recipe.rel.related_model._meta.db_table,
+        Recipe.shopping_recipe.rel.related_model._meta.db_table,
+        User.following.rel.related_model._meta.db_table,
+        Ingredient._meta.db_table,
+        ShoppingCartTotal._meta.db_table,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int,
+                            help='id пользователя для запросов')
+        parser.add_argument('--verbose-plans', action='store_true',
+                            help='Печатать планы целиком')
+
+    def recipes(self, user, **params):
+        """Страница списка рецептов с фильтрами, как в RecipeViewSet."""
+        request = RequestFactory().get('/api/recipes/', params)
+        request.user = user
+        return RecipeFilter(
+            request.GET, queryset=Recipe.objects.with_user_flags(user),
+            request=request).qs[:10]
+
+    def get_queries(self, user):
+        queries = {
+            'recipes-list': self.recipes(user),
+            'recipes-author': self.recipes(user, author=user.id),
+            'recipes-favorited': self.recipes(user, is_favorited=1),
+            'recipes-shopping-cart': self.recipes(
+                user, is_in_shopping_cart=1),
+            'users-subscriptions': User.objects.filter(
+                following__user=user)[:10],
+            'download-shopping-cart': ShoppingCartTotal.objects.filter(
+                user=user),
+        }
+        tags = tag_reference.get().data
+        if tags:
+            queries['recipes-tags'] = self.recipes(user, tags=tags[0]['slug'])
+        return queries
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING(
+                'Проверка планов рассчитана на PostgreSQL'))
+        user = (User.objects.get(id=options['user']) if options['user']
+                else User.objects.order_by('id').first())
+        if user is None:
+            raise CommandError('Нет пользователей: заполните базу данных')
+        failures = []
+        for name, queryset in self.get_queries(user).items():
+            plan = queryset.explain()
+            scans = set(SEQ_SCAN.findall(plan)) & self.checked_tables
+            if options['verbose_plans']:
+                self.stdout.write(f'{name}:\n{plan}\n')
+            if scans:
+                failures.append(f'{name}: {", ".join(sorted(scans))}')
+        if failures:
+            raise CommandError('Последовательное сканирование:\n'
+                               + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Планы запросов в порядке'))
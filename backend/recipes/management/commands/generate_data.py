@@ -0,0 +1,175 @@
+import random
+import time
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from faker import Faker
+
+from api.reference import ingredient_reference, tag_reference
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from users.models import Subscription, User
+
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+
+
+class Command(BaseCommand):
+    """Генерация синтетических данных для нагрузочного тестирования."""
+    help = ('Создаёт пользователей, теги, рецепты, избранное, корзины и '
+            'подписки пачками вставок')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument('--ingredients', type=int, default=500,
+                            help='Минимальный размер каталога ингредиентов')
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--tags-per-recipe', type=int, default=2)
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Избранных рецептов на пользователя')
+        parser.add_argument('--carts', type=int, default=5,
+                            help='Рецептов в корзине на пользователя')
+        parser.add_argument('--max-servings', type=int, default=1,
+                            help='Наибольшее число порций рецепта '
+                                 'в корзине')
+        parser.add_argument('--subscriptions', type=int, default=10,
+                            help='Подписок на пользователя')
+        parser.add_argument('--subscription-skew', type=float, default=0,
+                            help='Показатель степенного распределения '
+                                 'подписчиков по авторам; 0 — равномерно')
+        parser.add_argument('--password', default='benchmark-password')
+        parser.add_argument('--image', default='recipes/benchmark.png',
+                            help='Путь к изображению рецептов в MEDIA_ROOT')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--locale', default='ru_RU')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def bulk_create(self, model, objects, **kwargs):
+        """Вставляет объекты и возвращает id новых строк."""
+        last_id = model.objects.aggregate(last=Max('id'))['last'] or 0
+        model.objects.bulk_create(objects, batch_size=self.batch_size,
+                                  **kwargs)
+        return list(model.objects.filter(id__gt=last_id).order_by('id')
+                    .values_list('id', flat=True))
+
+    def create_users(self, count, password):
+        start = (User.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        password = make_password(password)
+        return self.bulk_create(User, [
+            User(username=f'user{number}',
+                 email=f'user{number}@example.com',
+                 first_name=self.faker.first_name(),
+                 last_name=self.faker.last_name(),
+                 password=password)
+            for number in range(start, start + count)
+        ])
+
+    def create_tags(self, count):
+        existing = Tag.objects.count()
+        self.bulk_create(Tag, [
+            Tag(name=f'{self.faker.word()} {number}',
+                color=self.faker.hex_color(),
+                slug=f'tag-{number}')
+            for number in range(existing + 1, count + 1)
+        ])
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def create_ingredients(self, count):
+        existing = Ingredient.objects.count()
+        Ingredient.objects.bulk_create([
+            Ingredient(name=f'{self.faker.word()} {number}',
+                       measurement_unit=self.random.choice(UNITS))
+            for number in range(existing + 1, count + 1)
+        ], batch_size=self.batch_size, ignore_conflicts=True)
+        return list(Ingredient.objects.values_list('id', flat=True))
+
+    def create_recipes(self, count, authors, image):
+        return self.bulk_create(Recipe, [
+            Recipe(name=self.faker.sentence(nb_words=3)[:200].rstrip('.'),
+                   text=self.faker.paragraph(nb_sentences=5),
+                   cooking_time=self.random.randint(5, 240),
+                   author_id=self.random.choice(authors),
+                   image=image)
+            for _ in range(count)
+        ])
+
+    def sample(self, population, count):
+        return self.random.sample(population, min(count, len(population)))
+
+    def create_relations(self, recipes, tags, ingredients, options):
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipes
+            for tag_id in self.sample(tags, options['tags_per_recipe'])
+        ], batch_size=self.batch_size)
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe_id=recipe_id, ingredient_id=ingredient_id,
+                             amount=self.random.randint(1, 500))
+            for recipe_id in recipes
+            for ingredient_id in self.sample(
+                ingredients, options['ingredients_per_recipe'])
+        ], batch_size=self.batch_size)
+
+    def sample_authors(self, authors, count, weights):
+        if weights is None:
+            return self.sample(authors, count)
+        return set(self.random.choices(authors, cum_weights=weights,
+                                       k=min(count, len(authors))))
+
+    def create_user_relations(self, users, recipes, authors, options):
+        Favorite.objects.bulk_create([
+            Favorite(user_id=user_id, recipe_id=recipe_id)
+            for user_id in users
+            for recipe_id in self.sample(recipes, options['favorites'])
+        ], batch_size=self.batch_size, ignore_conflicts=True)
+        ShoppingCart.objects.bulk_create([
+            ShoppingCart(user_id=user_id, recipe_id=recipe_id,
+                         servings=self.random.randint(
+                             1, options['max_servings']))
+            for user_id in users
+            for recipe_id in self.sample(recipes, options['carts'])
+        ], batch_size=self.batch_size, ignore_conflicts=True)
+        weights = None
+        if options['subscription_skew']:
+            weights = list(accumulate(
+                (rank + 1) ** -options['subscription_skew']
+                for rank in range(len(authors))))
+        Subscription.objects.bulk_create([
+            Subscription(user_id=user_id, author_id=author_id)
+            for user_id in users
+            for author_id in self.sample_authors(
+                authors, options['subscriptions'], weights)
+            if author_id != user_id
+        ], batch_size=self.batch_size, ignore_conflicts=True)
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.random = random.Random(options['seed'])
+        self.faker = Faker(options['locale'])
+        self.faker.seed_instance(options['seed'])
+        start = time.perf_counter()
+
+        with transaction.atomic():
+            users = self.create_users(options['users'], options['password'])
+            authors = users or list(
+                User.objects.values_list('id', flat=True))
+            tags = self.create_tags(options['tags'])
+            ingredients = self.create_ingredients(options['ingredients'])
+            recipes = self.create_recipes(options['recipes'], authors,
+                                          options['image'])
+            self.create_relations(recipes, tags, ingredients, options)
+            self.create_user_relations(users, recipes, authors, options)
+            call_command('reconcile_counters', stdout=self.stdout)
+            call_command('rebuild_shopping_cart_totals', stdout=self.stdout)
+            call_command('rebuild_search_index', stdout=self.stdout)
+            tag_reference.invalidate()
+            ingredient_reference.invalidate()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(users)}, рецептов: {len(recipes)} '
+            f'за {time.perf_counter() - start:.1f} с'))
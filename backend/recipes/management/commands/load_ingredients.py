@@ -0,0 +1,172 @@
+import csv
+import io
+import json
+import os
+import re
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.reference import ingredient_reference
+from recipes.models import Ingredient
+
+MAX_LENGTH = Ingredient._meta.get_field('name').max_length
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+SEPARATORS = re.compile(r'[\s,]*')
+WHITESPACE = re.compile(r'\s*')
+
+
+def read_json(file, chunk_size=64 * 1024):
+    """Построчно разбирает JSON-массив, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    while True:
+        chunk = file.read(chunk_size)
+        # Разобранное начало отбрасывается раз на кусок, а не на элемент.
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            if not started:
+                position = WHITESPACE.match(buffer, position).end()
+                if position == len(buffer):
+                    break
+                if buffer[position] != '[':
+                    raise CommandError('Ожидается JSON-массив')
+                position += 1
+                started = True
+            position = SEPARATORS.match(buffer, position).end()
+            if position == len(buffer) or buffer[position] == ']':
+                break
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if not chunk:
+                    raise CommandError('Некорректный JSON')
+                break
+            position = end
+            fields = item.get('fields', item)
+            yield fields.get('name'), fields.get('measurement_unit')
+        if not chunk:
+            return
+
+
+class Command(BaseCommand):
+    """Загрузка каталога ингредиентов из CSV или JSON."""
+    help = 'Загружает ингредиенты из CSV (name,unit) или JSON пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу CSV или JSON')
+        parser.add_argument('--format', choices=('csv', 'json'),
+                            help='Формат файла, по умолчанию по расширению')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Размер пачки строк')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только разобрать файл, не записывая')
+        parser.add_argument('--no-copy', action='store_true',
+                            help='Не использовать COPY на PostgreSQL')
+
+    def clean(self, rows):
+        for name, unit in rows:
+            name = (name or '').strip()
+            unit = (unit or '').strip()
+            if not name or not unit or max(len(name), len(unit)) > MAX_LENGTH:
+                self.skipped += 1
+                continue
+            yield name, unit
+
+    def batches(self, rows, size):
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, size))
+            if not batch:
+                return
+            yield batch
+
+    def load_bulk(self, batches):
+        """Вставка пачками; добавленные строки считает сама база."""
+        ops = connection.ops
+        fields = [Ingredient._meta.get_field(name)
+                  for name in ('name', 'measurement_unit')]
+        sql = '{} {} ({}) VALUES {{}} {}'.format(
+            ops.insert_statement(ignore_conflicts=True),
+            ops.quote_name(Ingredient._meta.db_table),
+            ', '.join(ops.quote_name(field.column) for field in fields),
+            ops.ignore_conflicts_suffix_sql(ignore_conflicts=True))
+        created = 0
+        with connection.cursor() as cursor:
+            for batch in batches:
+                size = ops.bulk_batch_size(fields, batch)
+                for start in range(0, len(batch), size):
+                    rows = batch[start:start + size]
+                    cursor.execute(
+                        sql.format(', '.join(['(%s, %s)'] * len(rows))),
+                        [value for row in rows for value in row])
+                    created += cursor.rowcount
+                self.parsed += len(batch)
+        return created
+
+    def load_copy(self, batches):
+        table = Ingredient._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE ingredient_import '
+                '(name varchar(200), measurement_unit varchar(200)) '
+                'ON COMMIT DROP')
+            for batch in batches:
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    'COPY ingredient_import FROM STDIN WITH (FORMAT csv)',
+                    buffer)
+                self.parsed += len(batch)
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT name, measurement_unit '
+                'FROM ingredient_import '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING')
+            created = cursor.rowcount
+            # Внешняя транзакция может загрузить каталог ещё раз.
+            cursor.execute('DROP TABLE ingredient_import')
+            return created
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or (
+            os.path.splitext(path)[1].lstrip('.').lower())
+        if file_format not in ('csv', 'json'):
+            raise CommandError('Укажите формат файла через --format')
+        reader = read_csv if file_format == 'csv' else read_json
+        self.parsed = self.skipped = 0
+        start = time.perf_counter()
+        with open(path, encoding='utf-8', newline='') as file:
+            batches = self.batches(self.clean(reader(file)),
+                                   options['batch_size'])
+            if options['dry_run']:
+                for batch in batches:
+                    self.parsed += len(batch)
+                created = 0
+            else:
+                use_copy = (connection.vendor == 'postgresql'
+                            and not options['no_copy'])
+                with transaction.atomic():
+                    created = (self.load_copy(batches) if use_copy
+                               else self.load_bulk(batches))
+                    ingredient_reference.invalidate()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано строк: {self.parsed}, добавлено: {created}, '
+            f'пропущено: {self.skipped}, '
+            f'{self.parsed / elapsed if elapsed else 0:.0f} строк/с'
+            + (' (пробный запуск)' if options['dry_run'] else '')))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from api.images import run_processing, unprocessed_recipes
+
+
+class Command(BaseCommand):
+    """Обработка изображений рецептов, оставшихся без миниатюр."""
+    help = ('Обрабатывает изображения рецептов, чья обработка не '
+            'завершилась, например потерялась при перезапуске')
+
+    def handle(self, *args, **options):
+        recipes = list(unprocessed_recipes().values_list('id', 'image'))
+        for recipe_id, name in recipes:
+            run_processing(recipe_id, name)
+        self.stdout.write(self.style.SUCCESS(
+            f'Изображений: {len(recipes)}, осталось без миниатюр: '
+            f'{unprocessed_recipes().count()}'))
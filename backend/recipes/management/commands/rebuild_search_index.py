@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from api.search import is_postgresql, recipe_index, update_documents
+from recipes.models import RecipeSearch
+
+
+class Command(BaseCommand):
+    """Пересборка поискового индекса рецептов."""
+    help = ('Пересобирает tsvector-документы рецептов в PostgreSQL или '
+            'сбрасывает индекс в памяти процессов для остальных баз')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if not is_postgresql(using):
+            recipe_index.journal.reset()
+            self.stdout.write(self.style.SUCCESS(
+                'Индекс в памяти будет пересобран при следующем поиске'))
+            return
+        start = time.perf_counter()
+        update_documents(using=using, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Поисковых документов: '
+            f'{RecipeSearch.objects.using(using).count()} '
+            f'за {time.perf_counter() - start:.1f} с'))
@@ -0,0 +1,92 @@
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Sum
+
+from api.exporters import shopping_cart_rows
+from recipes.models import Ingredient, RecipeIngredient, ShoppingCartTotal
+from recipes.units import normalize
+
+
+class Command(BaseCommand):
+    """Пересчёт итоговых количеств списков покупок."""
+    help = 'Пересчитывает итоги списков покупок и сверяет их с корзинами'
+    batch_size = 1000
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить итоги, не изменяя их',
+        )
+
+    def expected_totals(self):
+        return {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total in RecipeIngredient.objects
+            .filter(recipe__shopping_recipe__isnull=False)
+            .values_list('recipe__shopping_recipe__user', 'ingredient')
+            .annotate(total=Sum(
+                F('amount') * F('recipe__shopping_recipe__servings')))
+            .order_by()
+            .iterator()
+        }
+
+    def stored_totals(self):
+        return {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total in ShoppingCartTotal.objects
+            .values_list('user', 'ingredient', 'total')
+            .iterator()
+        }
+
+    def mismatched_rows(self, expected):
+        """Пользователи, чей список покупок расходится с пересчётом.
+
+        Ожидаемые строки приводятся к базовым единицам через normalize,
+        независимо от SQL-выражений shopping_cart_rows.
+        """
+        ingredients = Ingredient.objects.in_bulk(
+            {ingredient_id for _, ingredient_id in expected})
+        rows = defaultdict(Counter)
+        for (user_id, ingredient_id), total in expected.items():
+            ingredient = ingredients[ingredient_id]
+            unit, amount = normalize(ingredient.measurement_unit, total)
+            rows[user_id][ingredient.name, unit] += amount
+        return [
+            user_id for user_id, user_rows in rows.items()
+            if {(name, unit): amount for name, unit, amount
+                in shopping_cart_rows(user_id)} != user_rows
+        ]
+
+    @transaction.atomic
+    def rebuild(self, expected):
+        ShoppingCartTotal.objects.all().delete()
+        ShoppingCartTotal.objects.bulk_create(
+            (ShoppingCartTotal(user_id=user_id, ingredient_id=ingredient_id,
+                               total=total)
+             for (user_id, ingredient_id), total in expected.items()),
+            batch_size=self.batch_size,
+        )
+
+    def handle(self, *args, **options):
+        expected = self.expected_totals()
+        if not options['check']:
+            self.rebuild(expected)
+        stored = self.stored_totals()
+        mismatched = {
+            key for key in expected.keys() | stored.keys()
+            if expected.get(key) != stored.get(key)
+        }
+        if mismatched:
+            raise CommandError(
+                f'Итоги расходятся для {len(mismatched)} записей')
+        if options['check']:
+            users = self.mismatched_rows(expected)
+            if users:
+                raise CommandError(
+                    f'Списки покупок расходятся для {len(users)} '
+                    f'пользователей')
+        self.stdout.write(self.style.SUCCESS(
+            f'Итоги совпадают: {len(stored)} записей'))
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from api.feed import fanout_changed, pushes
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription, User
+
+
+def count_of(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            total=Count('pk')
+        ).values('total'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+class Command(BaseCommand):
+    """Сверка денормализованных счётчиков с фактическими данными."""
+    help = 'Исправляет расхождения счётчиков рецептов и пользователей'
+    batch_size = 1000
+    counters = (
+        (Recipe, 'favorites_count', Favorite, 'recipe'),
+        (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+        (User, 'recipes_count', Recipe, 'author'),
+        (User, 'followers_count', Subscription, 'author'),
+    )
+
+    def reconcile(self, model, field, related_model, related_field):
+        drifted, crossed = [], []
+        for obj in model.objects.annotate(
+            actual=count_of(related_model, related_field)
+        ).exclude(**{field: F('actual')}).only('pk', field).iterator():
+            if field == 'followers_count' and (
+                    pushes(getattr(obj, field)) != pushes(obj.actual)):
+                crossed.append(obj.pk)
+            setattr(obj, field, obj.actual)
+            drifted.append(obj)
+        model.objects.bulk_update(drifted, [field],
+                                  batch_size=self.batch_size)
+        fanout_changed(crossed)
+        return len(drifted)
+
+    def handle(self, *args, **options):
+        for counter in self.counters:
+            fixed = self.reconcile(*counter)
+            self.stdout.write(
+                f'{counter[0]._meta.model_name}.{counter[1]}: '
+                f'исправлено {fixed}')
@@ -1,7 +1,11 @@
+from collections import defaultdict
+
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
+from django.db.models import (BooleanField, Case, Exists, F, IntegerField,
+                              OuterRef, Prefetch, Subquery, Sum, Value, When)
 
-from users.models import User
+from users.models import Subscription, User
 
 
 class Ingredient(models.Model):
@@ -15,6 +19,10 @@ class Ingredient(models.Model):
         ordering = ['name']
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [models.UniqueConstraint(
+            fields=['name', 'measurement_unit'],
+            name='unique_ingredient')
+        ]
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}'
@@ -42,6 +50,51 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    """QuerySet рецептов с загрузкой связанных данных."""
+
+    @staticmethod
+    def related_lookups():
+        return (
+            'tags',
+            Prefetch('recipes',
+                     queryset=RecipeIngredient.objects.select_related(
+                         'ingredient')),
+        )
+
+    def with_related(self):
+        return self.select_related('author').prefetch_related(
+            *self.related_lookups())
+
+    def latest_by_author(self, authors, limit=None):
+        recipes = self.filter(author__in=authors)
+        if limit is not None:
+            recipes = recipes.filter(id__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).values('id')[:limit]
+            ))
+        grouped = defaultdict(list)
+        for recipe in recipes:
+            grouped[recipe.author_id].append(recipe)
+        return grouped
+
+    def with_user_flags(self, user):
+        if user.is_anonymous:
+            false = Value(False, output_field=BooleanField())
+            return self.annotate(is_favorited=false,
+                                 is_in_shopping_cart=false,
+                                 is_subscribed=false)
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_subscribed=Exists(Subscription.objects.filter(
+                user=user, author=OuterRef('author'))),
+        )
+
+
 class Recipe(models.Model):
     """Модель рецептов."""
     name = models.CharField(verbose_name='Название',
@@ -76,15 +129,44 @@ class Recipe(models.Model):
         verbose_name='Фото',
         upload_to='recipes/'
     )
+    thumbnail_list = models.ImageField(
+        verbose_name='Миниатюра для списка',
+        blank=True,
+        editable=False,
+    )
+    thumbnail_detail = models.ImageField(
+        verbose_name='Миниатюра для страницы рецепта',
+        blank=True,
+        editable=False,
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Количество в избранном',
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='Количество в списках покупок',
+        default=0,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ['-id']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [models.Index(
+            fields=['author', '-id'],
+            name='recipe_author_id_idx')
+        ]
 
     def __str__(self):
         return self.name
 
+    def get_amounts(self):
+        return dict(self.recipes.values_list('ingredient_id', 'amount'))
+
 
 class RecipeIngredient(models.Model):
     """Модель ингредиентов в рецепте."""
@@ -120,6 +202,56 @@ class RecipeIngredient(models.Model):
         )
 
 
+class SearchVectorField(models.Field):
+    """tsvector в PostgreSQL, текст в остальных базах."""
+
+    def db_type(self, connection):
+        if connection.vendor == 'postgresql':
+            return 'tsvector'
+        return 'text'
+
+
+@SearchVectorField.register_lookup
+class SearchMatch(models.Lookup):
+    """Совпадение tsvector с tsquery."""
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} @@ {rhs}', lhs_params + rhs_params
+
+
+class SearchIndex(models.Index):
+    """GIN-индекс в PostgreSQL, обычный индекс в остальных базах."""
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor == 'postgresql':
+            using = ' USING gin'
+        return super().create_sql(model, schema_editor, using=using,
+                                  **kwargs)
+
+
+class RecipeSearch(models.Model):
+    """Поисковый документ рецепта: название, ингредиенты и описание."""
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name='Рецепт',
+        related_name='search',
+    )
+    vector = SearchVectorField(verbose_name='Поисковый вектор', null=True)
+
+    class Meta:
+        verbose_name = 'Поисковый документ рецепта'
+        verbose_name_plural = 'Поисковые документы рецептов'
+        indexes = [SearchIndex(
+            fields=['vector'],
+            name='recipe_search_vector_idx')
+        ]
+
+
 class Favorite(models.Model):
     """Модель избранного."""
     user = models.ForeignKey(
@@ -142,11 +274,27 @@ class Favorite(models.Model):
             fields=['user', 'recipe'],
             name='unique_favorite')
         ]
+        indexes = [models.Index(
+            fields=['recipe', 'user'],
+            name='favorite_recipe_user_idx')
+        ]
 
     def __str__(self):
         return f'{self.user} добавил в избранное - {self.recipe}'
 
 
+class ShoppingCartQuerySet(models.QuerySet):
+    """QuerySet записей списка покупок."""
+
+    def total_amounts(self):
+        """Количества ингредиентов записей с учётом числа порций."""
+        return dict(self.filter(
+            recipe__recipes__isnull=False
+        ).values('recipe__recipes__ingredient_id').annotate(
+            total=Sum(F('recipe__recipes__amount') * F('servings'))
+        ).values_list('recipe__recipes__ingredient_id', 'total').order_by())
+
+
 class ShoppingCart(models.Model):
     """Модель списка покупок."""
     user = models.ForeignKey(
@@ -161,6 +309,14 @@ class ShoppingCart(models.Model):
         verbose_name='Рецепт',
         related_name='shopping_recipe',
     )
+    servings = models.PositiveSmallIntegerField(
+        verbose_name='Порций',
+        default=1,
+        validators=[MinValueValidator(
+            1, message='Значение не может быть меньше 1')]
+    )
+
+    objects = ShoppingCartQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Список покупок'
@@ -169,6 +325,124 @@ class ShoppingCart(models.Model):
             fields=['user', 'recipe'],
             name='unique_shopping_cart')
         ]
+        indexes = [models.Index(
+            fields=['recipe', 'user'],
+            name='shopping_cart_recipe_user_idx')
+        ]
 
     def __str__(self):
         return f'{self.user} добавил в список покупок - {self.recipe}'
+
+
+class RecipeSimilarity(models.Model):
+    """Похожий рецепт по совместным добавлениям в избранное и покупки."""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+        related_name='neighbours',
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Похожий рецепт',
+        related_name='neighbour_of',
+    )
+    score = models.FloatField(verbose_name='Косинусная близость')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        indexes = [models.Index(
+            fields=['recipe', '-score'],
+            name='recipe_similarity_score_idx')
+        ]
+
+
+class SimilarityBuild(models.Model):
+    """Сборка похожих рецептов и последние учтённые добавления."""
+    created = models.DateTimeField(verbose_name='Дата сборки',
+                                   auto_now_add=True)
+    full = models.BooleanField(verbose_name='Полная сборка')
+    last_favorite_id = models.PositiveBigIntegerField(default=0)
+    last_cart_id = models.PositiveBigIntegerField(default=0)
+    recipes = models.PositiveIntegerField(
+        verbose_name='Пересчитано рецептов', default=0)
+    duration = models.FloatField(verbose_name='Длительность, с', default=0)
+
+    class Meta:
+        ordering = ['-id']
+        verbose_name = 'Сборка похожих рецептов'
+        verbose_name_plural = 'Сборки похожих рецептов'
+
+    def __str__(self):
+        return f'{self.created:%Y-%m-%d %H:%M} ({self.recipes})'
+
+
+class ShoppingCartTotalQuerySet(models.QuerySet):
+    """QuerySet итоговых количеств списка покупок."""
+
+    def add_amounts(self, user_ids, amounts):
+        amounts = {key: value for key, value in amounts.items() if value}
+        user_ids = list(user_ids)
+        if not user_ids or not amounts:
+            return
+        self.bulk_create(
+            [ShoppingCartTotal(user_id=user_id, ingredient_id=ingredient_id)
+             for user_id in user_ids for ingredient_id in amounts],
+            ignore_conflicts=True,
+        )
+        self.filter(
+            user_id__in=user_ids, ingredient_id__in=amounts
+        ).update(total=F('total') + Case(
+            *[When(ingredient_id=ingredient_id, then=Value(amount))
+              for ingredient_id, amount in amounts.items()],
+            output_field=IntegerField(),
+        ))
+        self.filter(user_id__in=user_ids, total__lte=0).delete()
+
+    def subtract_amounts(self, user_ids, amounts):
+        self.add_amounts(
+            user_ids, {key: -value for key, value in amounts.items()})
+
+    def add_recipe_amounts(self, entries, amounts):
+        """Добавляет количества рецепта в корзины, умножая на порции."""
+        user_ids = defaultdict(list)
+        for user_id, servings in entries.values_list('user_id', 'servings'):
+            user_ids[servings].append(user_id)
+        for servings, users in user_ids.items():
+            self.add_amounts(users, {key: value * servings
+                                     for key, value in amounts.items()})
+
+    def subtract_recipe_amounts(self, entries, amounts):
+        self.add_recipe_amounts(
+            entries, {key: -value for key, value in amounts.items()})
+
+
+class ShoppingCartTotal(models.Model):
+    """Модель итоговых количеств ингредиентов в списке покупок."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='shopping_totals',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+    )
+    total = models.IntegerField(verbose_name='Количество', default=0)
+
+    objects = ShoppingCartTotalQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'ingredient'],
+            name='unique_shopping_cart_total')
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.total}'
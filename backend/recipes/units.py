@@ -0,0 +1,41 @@
+from django.db.models import Case, CharField, F, IntegerField, Value, When
+
+# Единица измерения -> (базовая единица, множитель). Совместимые единицы
+# складываются в списке покупок после приведения к базовой; остальные
+# («шт.», «по вкусу», «щепотка» и т. п.) суммируются как есть.
+# Стакан считается гранёным, ложки — столовой и чайной по объёму.
+UNITS = {
+    'г': ('г', 1),
+    'кг': ('г', 1000),
+    'мл': ('мл', 1),
+    'л': ('мл', 1000),
+    'стакан': ('мл', 200),
+    'ст. л.': ('мл', 15),
+    'ч. л.': ('мл', 5),
+}
+
+
+def normalize(unit, amount):
+    """Базовая единица и количество в ней."""
+    base, factor = UNITS.get(unit, (unit, 1))
+    return base, amount * factor
+
+
+def base_unit(field):
+    """Выражение базовой единицы для поля с единицей измерения."""
+    return Case(
+        *[When(**{field: unit}, then=Value(base))
+          for unit, (base, _) in UNITS.items()],
+        default=F(field),
+        output_field=CharField(),
+    )
+
+
+def unit_factor(field):
+    """Выражение множителя перевода в базовую единицу."""
+    return Case(
+        *[When(**{field: unit}, then=Value(factor))
+          for unit, (_, factor) in UNITS.items()],
+        default=Value(1),
+        output_field=IntegerField(),
+    )
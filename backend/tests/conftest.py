@@ -0,0 +1,93 @@
+import pytest
+from django.core.cache import cache
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def make_user(django_user_model):
+    def make(username, **fields):
+        return django_user_model.objects.create_user(
+            email=f'{username}@example.com', username=username,
+            password='password', **fields)
+    return make
+
+
+@pytest.fixture
+def user(make_user):
+    return make_user('user')
+
+
+@pytest.fixture
+def author(make_user):
+    return make_user('author')
+
+
+@pytest.fixture
+def client():
+    return APIClient()
+
+
+@pytest.fixture
+def user_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def author_client(author):
+    client = APIClient()
+    client.force_authenticate(author)
+    return client
+
+
+@pytest.fixture
+def tag():
+    return Tag.objects.create(name='Завтрак', color='#E26C2D',
+                              slug='breakfast')
+
+
+@pytest.fixture
+def ingredients():
+    return [
+        Ingredient.objects.create(name=name, measurement_unit=unit)
+        for name, unit in (('Мука', 'г'), ('Молоко', 'мл'), ('Яйца', 'шт.'))
+    ]
+
+
+@pytest.fixture
+def make_recipes(author, tag, ingredients):
+    def make(count, author=author):
+        recipes = [
+            Recipe.objects.create(name=f'Рецепт {number}', text='Описание',
+                                  cooking_time=10, author=author,
+                                  image='recipes/test.png')
+            for number in range(count)
+        ]
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in recipes
+        ])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                             amount=number + 1)
+            for recipe in recipes
+            for number, ingredient in enumerate(ingredients)
+        ])
+        return recipes
+    return make
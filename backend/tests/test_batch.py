@@ -0,0 +1,60 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from api.counters import bulk_insert
+from recipes.models import Favorite, Recipe
+from users.models import Subscription
+
+pytestmark = pytest.mark.django_db
+
+
+def test_bulk_insert_skips_rows_inserted_concurrently(make_recipes, user):
+    first, second = make_recipes(2)
+    Favorite.objects.create(user=user, recipe=first)
+    inserted = bulk_insert([Favorite(user=user, recipe=first),
+                            Favorite(user=user, recipe=second)], 'recipe_id')
+    assert inserted == {second.id}
+    assert Favorite.objects.filter(user=user).count() == 2
+
+
+def test_favorite_reads_recipe_with_counter(make_recipes, user_client):
+    recipe, = make_recipes(1)
+    with CaptureQueriesContext(connection) as queries:
+        response = user_client.post(f'/api/recipes/{recipe.id}/favorite/')
+    assert response.status_code == 201
+    assert response.json()['name'] == recipe.name
+    assert sum('recipes_recipe' in query['sql']
+               for query in queries.captured_queries) == (
+        1 if connection.vendor == 'postgresql' else 2)
+    response = user_client.post(f'/api/recipes/{recipe.id}/favorite/')
+    assert response.status_code == 400
+    for pk in (recipe.id + 1, 'recipe'):
+        response = user_client.post(f'/api/recipes/{pk}/favorite/')
+        assert response.status_code == 404
+    recipe.refresh_from_db()
+    assert recipe.favorites_count == 1
+
+
+def test_favorite_batch_counts_only_created(make_recipes, user, user_client):
+    first, second = make_recipes(2)
+    user_client.post(f'/api/recipes/{first.id}/favorite/')
+    response = user_client.post('/api/recipes/favorite/',
+                                {'ids': [first.id, second.id]},
+                                format='json')
+    assert [item['status'] for item in response.json()['results']] == [
+        'exists', 'created']
+    assert dict(Recipe.objects.values_list('id', 'favorites_count')) == {
+        first.id: 1, second.id: 1}
+
+
+def test_subscribe_batch_counts_only_created(make_user, user, user_client):
+    authors = [make_user(f'author{number}') for number in range(2)]
+    Subscription.objects.create(user=user, author=authors[0])
+    response = user_client.post(
+        '/api/users/subscribe/',
+        {'ids': [author.id for author in authors]}, format='json')
+    assert [item['status'] for item in response.json()['results']] == [
+        'exists', 'created']
+    authors[1].refresh_from_db()
+    assert authors[1].followers_count == 1
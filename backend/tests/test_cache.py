@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+import pytest
+
+from api.cache import get_recipes, get_stats, invalidate_recipes
+
+
+@pytest.mark.django_db
+def test_write_after_invalidation_is_not_served(
+        django_capture_on_commit_callbacks):
+    recipe = SimpleNamespace(id=1)
+
+    def build_stale(recipes):
+        with django_capture_on_commit_callbacks(execute=True):
+            invalidate_recipes([recipe.id])
+        return {recipe.id: 'stale' for recipe in recipes}
+
+    assert get_recipes([recipe], build_stale) == {1: 'stale'}
+    fresh = get_recipes([recipe], lambda recipes: {1: 'fresh'})
+    assert fresh == {1: 'fresh'}
+    assert get_recipes([recipe], lambda recipes: {}) == {1: 'fresh'}
+
+
+def test_stats_are_kept_in_process():
+    before = get_stats()
+    recipe = SimpleNamespace(id=2)
+    get_recipes([recipe], lambda recipes: {2: 'built'})
+    get_recipes([recipe], lambda recipes: {})
+    stats = get_stats()
+    assert stats['hits'] == before['hits'] + 1
+    assert stats['misses'] == before['misses'] + 1
+
+
+@pytest.mark.django_db
+def test_second_page_load_hits_cache(client, make_recipes):
+    make_recipes(200)
+
+    def load_pages():
+        before = get_stats()
+        for page in range(1, 5):
+            response = client.get('/api/recipes/', {'page': page,
+                                                    'limit': 50})
+            assert response.status_code == 200
+        after = get_stats()
+        return (after['hits'] - before['hits'],
+                after['misses'] - before['misses'])
+
+    assert load_pages() == (0, 200)
+    assert load_pages() == (200, 0)
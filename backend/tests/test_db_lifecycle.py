@@ -0,0 +1,87 @@
+import pytest
+from django.db import OperationalError, connection
+
+from api.metrics import registry
+from foodgram.db import lifecycle
+from foodgram.db.postgresql.base import DatabaseWrapper
+
+pytestmark = [
+    pytest.mark.django_db,
+    pytest.mark.skipif(
+        connection.settings_dict['ENGINE'] != 'foodgram.db.postgresql',
+        reason='Жизненный цикл соединений есть только у foodgram.db'),
+]
+
+
+@pytest.fixture
+def make_wrapper(request):
+    wrappers = []
+
+    def make(**settings):
+        alias = f'lifecycle-{request.node.name}'
+        wrapper = DatabaseWrapper(
+            dict(connection.settings_dict, CONN_HEALTH_CHECKS=True,
+                 **settings), alias)
+        wrappers.append(wrapper)
+        return wrapper
+
+    yield make
+    for wrapper in wrappers:
+        wrapper.close()
+    for wrapper in wrappers:
+        pool = lifecycle.pools.pop(wrapper.alias, None)
+        while pool is not None and pool.idle:
+            lifecycle.close_quietly(pool.idle.pop()[1])
+
+
+def end_request(wrapper):
+    wrapper.close_if_unusable_or_obsolete()
+
+
+def query(wrapper):
+    with wrapper.cursor() as cursor:
+        cursor.execute('SELECT 1')
+        return cursor.fetchone()[0]
+
+
+def counter(wrapper, name):
+    return registry.value(name, wrapper.alias)
+
+
+def test_persistent_connection_is_checked_and_replaced(make_wrapper):
+    wrapper = make_wrapper(CONN_MAX_AGE=60, POOL_SIZE=0)
+    query(wrapper)
+    first = wrapper.connection
+    end_request(wrapper)
+    assert query(wrapper) == 1
+    assert wrapper.connection is first
+    assert counter(wrapper, 'db_connections_reused_total') == 1
+
+    end_request(wrapper)
+    first.close()
+    assert query(wrapper) == 1
+    assert wrapper.connection is not first
+    assert counter(wrapper, 'db_health_check_failures_total') == 1
+    assert counter(wrapper, 'db_connections_opened_total') == 2
+
+
+def test_pool_reuses_and_replaces_dead_connections(make_wrapper):
+    wrapper = make_wrapper(CONN_MAX_AGE=0, POOL_SIZE=1, POOL_TIMEOUT=0.1)
+    query(wrapper)
+    first = wrapper.connection
+    end_request(wrapper)
+    assert wrapper.connection is None
+    assert query(wrapper) == 1
+    assert wrapper.connection is first
+
+    other = make_wrapper(CONN_MAX_AGE=0, POOL_SIZE=1, POOL_TIMEOUT=0.1)
+    with pytest.raises(OperationalError):
+        query(other)
+    assert counter(wrapper, 'db_pool_timeouts_total') == 1
+
+    end_request(wrapper)
+    first.close()
+    assert query(other) == 1
+    assert other.connection is not first
+    assert counter(wrapper, 'db_health_check_failures_total') == 1
+    assert counter(wrapper, 'db_connections_opened_total') == 2
@@ -0,0 +1,67 @@
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from rest_framework.test import APIClient
+
+from api import feed
+from users.models import User
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def threshold(monkeypatch):
+    monkeypatch.setattr(feed, 'FEED_FANOUT_THRESHOLD', 2)
+
+
+@pytest.fixture
+def run(django_capture_on_commit_callbacks):
+    def run(method, *args, **kwargs):
+        with django_capture_on_commit_callbacks(execute=True):
+            return method(*args, **kwargs)
+    return run
+
+
+@pytest.fixture
+def other_client(make_user):
+    client = APIClient()
+    client.force_authenticate(make_user('other'))
+    return client
+
+
+@pytest.fixture
+def recipe(make_recipes):
+    return make_recipes(1)[0]
+
+
+def feed_names(client):
+    response = client.get('/api/recipes/feed/', {'limit': 10})
+    assert response.status_code == 200
+    return [recipe['name'] for recipe in response.json()['results']]
+
+
+def test_author_starts_pushing(recipe, author, user_client, other_client,
+                               run):
+    run(user_client.post, f'/api/users/{author.id}/subscribe/')
+    run(other_client.post, f'/api/users/{author.id}/subscribe/')
+    assert feed_names(user_client) == [recipe.name]
+    run(other_client.delete, f'/api/users/{author.id}/subscribe/')
+    assert feed_names(user_client) == [recipe.name]
+
+
+def test_author_stops_pushing(recipe, author, user, user_client,
+                              other_client, run):
+    run(user_client.post, f'/api/users/{author.id}/subscribe/')
+    assert feed_names(user_client) == [recipe.name]
+    run(other_client.post, '/api/users/subscribe/', {'ids': [author.id]},
+        format='json')
+    assert cache.get(feed.inbox_key(user.id)) is None
+    assert feed_names(user_client) == [recipe.name]
+
+
+def test_reconciled_followers_count(recipe, author, user_client, run):
+    run(user_client.post, f'/api/users/{author.id}/subscribe/')
+    User.objects.filter(id=author.id).update(followers_count=5)
+    assert feed_names(user_client) == [recipe.name]
+    run(call_command, 'reconcile_counters')
+    assert feed_names(user_client) == [recipe.name]
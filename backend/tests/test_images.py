@@ -0,0 +1,82 @@
+import base64
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+
+import pytest
+from django.core.management import call_command
+from PIL import Image
+
+from api import images
+from recipes.models import Recipe
+
+
+def image_data(color='red'):
+    buffer = BytesIO()
+    Image.new('RGB', (64, 64), color).save(buffer, format='PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+def recipe_data(tag, ingredients, color='red'):
+    return {
+        'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 10,
+        'tags': [tag.id], 'image': image_data(color),
+        'ingredients': [{'id': ingredients[0].id, 'amount': 1}],
+    }
+
+
+def image_files(recipe):
+    return [recipe.image.name, recipe.thumbnail_list.name,
+            recipe.thumbnail_detail.name]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_write_response_does_not_cache_unprocessed_image(
+        media_root, monkeypatch, author_client, tag, ingredients):
+    monkeypatch.setattr(images, 'executor', None)
+    response = author_client.post('/api/recipes/',
+                                  recipe_data(tag, ingredients),
+                                  format='json')
+    assert response.status_code == 201
+    detail = author_client.get(f'/api/recipes/{response.json()["id"]}/')
+    image = detail.json()['image']
+    assert '/processed/' in image or '/cache/' in image
+    assert (media_root / image.split('/media/', 1)[1]).exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_lost_processing_is_resumed(media_root, monkeypatch, author_client,
+                                    tag, ingredients):
+    monkeypatch.setattr(images, 'executor',
+                        SimpleNamespace(submit=lambda *args: None))
+    response = author_client.post('/api/recipes/',
+                                  recipe_data(tag, ingredients),
+                                  format='json')
+    recipe = Recipe.objects.get(id=response.json()['id'])
+    assert list(images.unprocessed_recipes()) == [recipe]
+    call_command('process_recipe_images', stdout=StringIO())
+    recipe.refresh_from_db()
+    assert '/processed/' in recipe.image.name
+    assert all((media_root / name).exists() for name in image_files(recipe))
+    assert not images.unprocessed_recipes().exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_replaced_image_is_deleted(media_root, monkeypatch, author_client,
+                                   tag, ingredients):
+    monkeypatch.setattr(images, 'executor', None)
+    response = author_client.post('/api/recipes/',
+                                  recipe_data(tag, ingredients),
+                                  format='json')
+    recipe = Recipe.objects.get(id=response.json()['id'])
+    response = author_client.patch(f'/api/recipes/{recipe.id}/',
+                                   recipe_data(tag, ingredients, 'blue'),
+                                   format='json')
+    assert response.status_code == 200
+    recipe.refresh_from_db()
+    stored = {str(path.relative_to(media_root))
+              for path in media_root.rglob('*') if path.is_file()}
+    assert stored == set(image_files(recipe))
+    for name in stored:
+        with Image.open(media_root / name) as image:
+            assert image.convert('RGB').getpixel((0, 0)) == (0, 0, 255)
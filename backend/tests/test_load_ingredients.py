@@ -0,0 +1,36 @@
+import json
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from recipes.models import Ingredient
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def catalogue(tmp_path):
+    path = tmp_path / 'ingredients.json'
+    path.write_text(json.dumps(
+        [{'name': f'Ингредиент {number}', 'measurement_unit': 'г'}
+         for number in range(2500)]
+        + [{'name': 'Ингредиент 0', 'measurement_unit': 'г'},
+           {'name': '', 'measurement_unit': 'г'}],
+        ensure_ascii=False, indent=1), encoding='utf-8')
+    return str(path)
+
+
+@pytest.mark.parametrize('no_copy', [False, True])
+def test_load_counts_inserted_rows(catalogue, no_copy):
+    Ingredient.objects.create(name='Ингредиент 1', measurement_unit='г')
+
+    def load():
+        out = StringIO()
+        call_command('load_ingredients', catalogue, batch_size=1000,
+                     no_copy=no_copy, stdout=out)
+        return out.getvalue()
+
+    assert 'Обработано строк: 2501, добавлено: 2499, пропущено: 1' in load()
+    assert 'добавлено: 0,' in load()
+    assert Ingredient.objects.count() == 2500
@@ -0,0 +1,49 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from api.metrics import registry
+
+pytestmark = pytest.mark.django_db
+
+
+def test_metrics_denied_without_token(client, user_client):
+    assert client.get('/api/metrics/').status_code == 403
+    assert user_client.get('/api/metrics/').status_code == 403
+
+
+def test_metrics_for_staff(client, make_user):
+    staff = make_user('admin', is_staff=True)
+    token = Token.objects.create(user=staff)
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    assert client.get('/api/metrics/').status_code == 200
+    client.credentials()
+    client.force_login(staff)
+    assert client.get('/api/metrics/').status_code == 200
+
+
+def test_metrics_token(client, monkeypatch):
+    monkeypatch.setattr('api.views.metrics.METRICS_TOKEN', 'secret')
+    client.credentials(HTTP_AUTHORIZATION='Bearer wrong')
+    assert client.get('/api/metrics/').status_code == 403
+    client.credentials(HTTP_AUTHORIZATION='Bearer secret')
+    assert client.get('/api/metrics/').status_code == 200
+
+
+def test_streaming_body_queries_recorded(make_recipes, user_client,
+                                         monkeypatch):
+    recipe, = make_recipes(1)
+    user_client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+    observed = []
+    monkeypatch.setattr(registry, 'observe',
+                        lambda view, metrics: observed.append(metrics))
+    response = user_client.get('/api/recipes/download_shopping_cart/')
+    assert observed == []
+    with CaptureQueriesContext(connection) as body:
+        content = b''.join(response.streaming_content).decode()
+    assert 'Мука' in content
+    assert body.captured_queries
+    metrics, = observed
+    assert metrics.queries >= len(body.captured_queries)
+    assert connection.execute_wrappers == []
@@ -0,0 +1,30 @@
+import pytest
+
+from recipes.models import RecipeIngredient
+
+
+def pantry(client, ingredients):
+    response = client.get('/api/recipes/pantry/', {
+        'ingredients': ','.join(str(ingredient.id)
+                                for ingredient in ingredients)})
+    assert response.status_code == 200
+    return [(recipe['name'], recipe['matched'], recipe['missing'])
+            for recipe in response.json()]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_recipes_changed_outside_transaction(make_recipes, ingredients,
+                                             client):
+    flour, milk, eggs = ingredients
+    first, = make_recipes(1)
+    assert pantry(client, [flour, milk]) == [('Рецепт 0', 2, 1)]
+    second, = make_recipes(1)
+    second.name = 'Блины'
+    second.save()
+    assert pantry(client, [flour, milk]) == [
+        ('Блины', 2, 1), ('Рецепт 0', 2, 1)]
+    RecipeIngredient.objects.filter(recipe=first, ingredient=eggs).delete()
+    assert pantry(client, [flour, milk]) == [
+        ('Рецепт 0', 2, 0), ('Блины', 2, 1)]
+    first.delete()
+    assert pantry(client, [flour, milk]) == [('Блины', 2, 1)]
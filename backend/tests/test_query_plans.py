@@ -0,0 +1,19 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+
+pytestmark = [
+    pytest.mark.django_db,
+    pytest.mark.skipif(connection.vendor != 'postgresql',
+                       reason='Планы запросов проверяются на PostgreSQL'),
+]
+
+
+def test_main_queries_avoid_sequential_scans(media_root):
+    call_command('generate_data', users=200, recipes=5000, favorites=20,
+                 carts=5, subscriptions=10, seed=1, stdout=StringIO())
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    call_command('explain_queries', stdout=StringIO())
@@ -0,0 +1,88 @@
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from api.pagination import cached_count
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription
+
+
+def count_queries(client, path, params):
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(path, params)
+    assert response.status_code == 200
+    return response, len(context)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('cached', [False, True])
+def test_recipe_list_queries_do_not_grow_with_page_size(
+        user, user_client, author, make_recipes, cached):
+    recipes = make_recipes(25)
+    Favorite.objects.create(user=user, recipe=recipes[0])
+    ShoppingCart.objects.create(user=user, recipe=recipes[1])
+    Subscription.objects.create(user=user, author=author)
+
+    counts = []
+    for limit in (5, 25):
+        cache.clear()
+        if cached:
+            user_client.get('/api/recipes/', {'limit': limit})
+        response, queries = count_queries(
+            user_client, '/api/recipes/', {'limit': limit})
+        assert len(response.data['results']) == limit
+        counts.append(queries)
+    assert counts[0] == counts[1]
+
+    results = {item['id']: item for item in response.data['results']}
+    assert results[recipes[0].id]['is_favorited']
+    assert results[recipes[1].id]['is_in_shopping_cart']
+    assert results[recipes[2].id]['author']['is_subscribed']
+    assert len(results[recipes[2].id]['ingredients']) == 3
+
+
+@pytest.mark.django_db
+def test_recipe_list_queries_do_not_grow_for_anonymous(client, make_recipes):
+    make_recipes(25)
+    counts = []
+    for limit in (5, 25):
+        cache.clear()
+        counts.append(count_queries(
+            client, '/api/recipes/', {'limit': limit})[1])
+    assert counts[0] == counts[1]
+
+
+@pytest.mark.django_db
+def test_recipe_list_cursor(client, make_recipes):
+    recipes = make_recipes(3)
+    response = client.get('/api/recipes/', {'cursor': '', 'limit': 2})
+    assert response.status_code == 200
+    data = response.json()
+    assert data['count'] == 3
+    assert [recipe['id'] for recipe in data['results']] == [
+        recipe.id for recipe in recipes[:0:-1]]
+    response = client.get(data['next'])
+    assert [recipe['id'] for recipe in response.json()['results']] == [
+        recipes[0].id]
+    response = client.get('/api/recipes/',
+                          {'cursor': '', 'ordering': 'id', 'limit': 2})
+    assert [recipe['id'] for recipe in response.json()['results']] == [
+        recipe.id for recipe in recipes[:2]]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('params', [
+    {'search': 'рецепт'}, {'ordering': '-favorites_count'}])
+def test_recipe_list_cursor_rejects_other_ordering(
+        client, make_recipes, params):
+    make_recipes(1)
+    response = client.get('/api/recipes/', {'cursor': '', **params})
+    assert response.status_code == 400
+    assert 'cursor' in response.json()
+
+
+@pytest.mark.django_db
+def test_cached_count_of_empty_queryset():
+    assert cached_count(Recipe.objects.none()) == 0
+    assert cached_count(Recipe.objects.filter(id__in=[])) == 0
@@ -0,0 +1,35 @@
+import pytest
+
+from api import reference
+from api.fields import ReferencePrimaryKeyField
+from api.reference import tag_reference
+from recipes.models import Ingredient, Tag
+
+pytestmark = pytest.mark.django_db
+
+
+def test_field_finds_object_missing_from_snapshot(tag):
+    tag_reference.get()
+    created = Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+    assert created.id not in tag_reference.get().objects
+    field = ReferencePrimaryKeyField(reference=tag_reference)
+    assert field.to_internal_value(created.id) == created
+
+
+def test_snapshot_expires_without_version_change(tag, monkeypatch):
+    snapshot = tag_reference.get()
+    Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+    monkeypatch.setattr(reference, 'REFERENCE_CACHE_TTL', -1)
+    fresh = tag_reference.get()
+    assert {row['slug'] for row in fresh.data} == {'breakfast', 'lunch'}
+    assert fresh.version != snapshot.version
+    assert tag_reference.get().version == fresh.version
+
+
+def test_ingredient_search(client, ingredients):
+    Ingredient.objects.create(name='Сгущённое молоко', measurement_unit='г')
+    response = client.get('/api/ingredients/', {'name': 'МОЛ'})
+    assert [row['name'] for row in response.json()] == [
+        'Молоко', 'Сгущённое молоко']
+    response = client.get('/api/ingredients/', {'name': 'мол', 'limit': 1})
+    assert [row['name'] for row in response.json()] == ['Молоко']
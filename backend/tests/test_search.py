@@ -0,0 +1,142 @@
+import sqlite3
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from api import search
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+
+pytestmark = pytest.mark.django_db
+postgresql = pytest.mark.skipif(connection.vendor != 'postgresql',
+                                reason='Поиск через tsvector')
+in_memory = pytest.mark.skipif(connection.vendor == 'postgresql',
+                               reason='Индекс в памяти процесса')
+
+
+@pytest.fixture
+def recipes(author, django_capture_on_commit_callbacks):
+    potato = Ingredient.objects.create(name='Картофель',
+                                       measurement_unit='г')
+    chicken = Ingredient.objects.create(name='Курица', measurement_unit='г')
+    recipes = {}
+    with django_capture_on_commit_callbacks(execute=True):
+        for name, text, ingredients in (
+                ('Картофель с пюре', 'Пюре на молоке', [potato]),
+                ('Куриный суп', 'Суп с картофелем и лапшой',
+                 [chicken, potato]),
+                ('Курица в духовке', 'Запечённая курица', [chicken])):
+            recipe = recipes[name] = Recipe.objects.create(
+                name=name, text=text, cooking_time=10, author=author,
+                image='recipes/test.png')
+            for ingredient in ingredients:
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=1)
+    return recipes
+
+
+def found(client, query, **params):
+    response = client.get('/api/recipes/',
+                          {'search': query, 'limit': 10, **params})
+    assert response.status_code == 200
+    data = response.json()
+    return data['count'], [recipe['name'] for recipe in data['results']]
+
+
+@postgresql
+def test_postgresql_search(recipes, client):
+    assert found(client, 'картофель') == (
+        2, ['Картофель с пюре', 'Куриный суп'])
+    count, names = found(client, 'кури*')
+    assert count == 2
+    assert set(names) == {'Курица в духовке', 'Куриный суп'}
+    assert found(client, '"картофелем и лапшой"') == (1, ['Куриный суп'])
+    assert found(client, 'курица пюре') == (0, [])
+
+
+@postgresql
+def test_recipe_changes_reindex_once_per_transaction(
+        author, django_capture_on_commit_callbacks):
+    ingredients = [Ingredient.objects.create(name=f'Ингредиент {number}',
+                                             measurement_unit='г')
+                   for number in range(5)]
+    with CaptureQueriesContext(connection) as queries:
+        with django_capture_on_commit_callbacks(execute=True):
+            recipe = Recipe.objects.create(
+                name='Рецепт', text='Описание', cooking_time=10,
+                author=author, image='recipes/test.png')
+            for ingredient in ingredients:
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=1)
+    assert sum('INSERT INTO recipes_recipesearch' in query['sql']
+               for query in queries.captured_queries) == 1
+
+
+@in_memory
+def test_in_memory_search_counts_all_matches(recipes, client):
+    assert found(client, 'картофель') == (
+        2, ['Картофель с пюре', 'Куриный суп'])
+    assert found(client, 'картофель', ordering='id') == (
+        2, ['Картофель с пюре', 'Куриный суп'])
+    recipe = recipes['Куриный суп']
+    assert client.get(f'/api/recipes/{recipe.id}/',
+                      {'search': 'картофель'}).status_code == 200
+    assert client.get(f'/api/recipes/{recipe.id}/',
+                      {'search': 'пюре'}).status_code == 404
+
+
+@pytest.fixture
+def sqlite_variable_limit():
+    connection.ensure_connection()
+    if not hasattr(connection.connection, 'setlimit'):
+        pytest.skip('Лимит параметров SQLite меняется с Python 3.11')
+    limit = sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER
+    previous = connection.connection.setlimit(limit, 999)
+    yield
+    connection.connection.setlimit(limit, previous)
+
+
+@in_memory
+def test_in_memory_search_pages_many_matches(author, client,
+                                             sqlite_variable_limit):
+    recipes = Recipe.objects.bulk_create([
+        Recipe(name=f'Суп {number}', text='Описание', cooking_time=10,
+               author=author, image='recipes/test.png')
+        for number in range(1200)])
+    search.recipe_index.rebuild(search.recipe_index.journal.get_sequence())
+    ids = sorted(recipe.id for recipe in Recipe.objects.all())
+    for params, expected in (({'page': 3}, ids[::-1][20:30]),
+                             ({'ordering': 'id'}, ids[:10])):
+        response = client.get('/api/recipes/',
+                              {'search': 'суп', 'limit': 10, **params})
+        assert response.status_code == 200
+        data = response.json()
+        assert data['count'] == len(recipes)
+        assert [recipe['id'] for recipe in data['results']] == expected
+
+
+@in_memory
+def test_in_memory_index_applies_changes(
+        recipes, client, monkeypatch, django_capture_on_commit_callbacks):
+    assert found(client, 'пюре') == (1, ['Картофель с пюре'])
+    rebuilds = []
+    monkeypatch.setattr(search.recipe_index, 'rebuild', rebuilds.append)
+    recipe = recipes['Курица в духовке']
+    recipe.name = 'Курица с пюре'
+    with django_capture_on_commit_callbacks(execute=True):
+        recipe.save()
+    assert found(client, 'пюре') == (
+        2, ['Картофель с пюре', 'Курица с пюре'])
+    assert rebuilds == []
+
+
+@pytest.mark.django_db(transaction=True)
+def test_recipe_saved_outside_transaction(author, client):
+    recipe = Recipe.objects.create(
+        name='Щи', text='Описание', cooking_time=10, author=author,
+        image='recipes/test.png')
+    assert found(client, 'щи') == (1, ['Щи'])
+    recipe.name = 'Борщ'
+    recipe.save()
+    assert found(client, 'борщ') == (1, ['Борщ'])
+    assert found(client, 'щи') == (0, [])
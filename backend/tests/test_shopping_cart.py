@@ -0,0 +1,101 @@
+import pytest
+from django.core.management import call_command
+
+from api.exporters import shopping_cart_rows
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingCartTotal)
+
+pytestmark = pytest.mark.django_db
+
+
+def stored_totals(user):
+    return dict(ShoppingCartTotal.objects.filter(
+        user=user).values_list('ingredient__name', 'total'))
+
+
+def assert_consistent():
+    call_command('rebuild_shopping_cart_totals', check=True)
+
+
+@pytest.fixture
+def recipes(make_recipes, user_client):
+    recipes = make_recipes(2)
+    for recipe in recipes:
+        response = user_client.post(
+            f'/api/recipes/{recipe.id}/shopping_cart/')
+        assert response.status_code == 201
+    return recipes
+
+
+def test_api_changes_keep_totals(recipes, user, user_client):
+    first, second = recipes
+    assert stored_totals(user) == {'Мука': 2, 'Молоко': 4, 'Яйца': 6}
+    user_client.patch(f'/api/recipes/{first.id}/shopping_cart/',
+                      {'servings': 3})
+    assert stored_totals(user) == {'Мука': 4, 'Молоко': 8, 'Яйца': 12}
+    user_client.delete(f'/api/recipes/{second.id}/shopping_cart/')
+    assert stored_totals(user) == {'Мука': 3, 'Молоко': 6, 'Яйца': 9}
+    user_client.delete('/api/recipes/shopping_cart/',
+                       {'ids': [first.id]}, format='json')
+    assert stored_totals(user) == {}
+    assert_consistent()
+
+
+def test_recipe_deleted_outside_api(recipes, user):
+    Recipe.objects.get(id=recipes[0].id).delete()
+    assert stored_totals(user) == {'Мука': 1, 'Молоко': 2, 'Яйца': 3}
+    assert_consistent()
+
+
+def test_cart_and_ingredient_changes_outside_api(recipes, user, author):
+    first, second = recipes
+    entry = ShoppingCart.objects.get(user=user, recipe=first)
+    entry.servings = 4
+    entry.save()
+    assert stored_totals(user) == {'Мука': 5, 'Молоко': 10, 'Яйца': 15}
+    entry.user = author
+    entry.save()
+    assert stored_totals(user) == {'Мука': 1, 'Молоко': 2, 'Яйца': 3}
+    row = RecipeIngredient.objects.get(
+        recipe=second, ingredient__name='Мука')
+    row.amount = 10
+    row.save()
+    RecipeIngredient.objects.filter(
+        recipe=second, ingredient__name='Яйца').delete()
+    assert stored_totals(user) == {'Мука': 10, 'Молоко': 2}
+    Ingredient.objects.filter(name='Молоко').delete()
+    assert stored_totals(author) == {'Мука': 4, 'Яйца': 12}
+    ShoppingCart.objects.filter(user=user).delete()
+    assert stored_totals(user) == {}
+    assert_consistent()
+
+
+def test_recipe_update_keeps_totals(recipes, user, author_client,
+                                    ingredients, tag):
+    flour, milk, _ = ingredients
+    response = author_client.patch(
+        f'/api/recipes/{recipes[0].id}/',
+        {'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 10,
+         'tags': [tag.id],
+         'ingredients': [{'id': flour.id, 'amount': 5},
+                         {'id': milk.id, 'amount': 2}]},
+        format='json')
+    assert response.status_code == 200
+    assert stored_totals(user) == {'Мука': 6, 'Молоко': 4, 'Яйца': 3}
+    assert_consistent()
+
+
+def test_compatible_units_are_summed(make_recipes, user, user_client):
+    recipe = make_recipes(1)[0]
+    RecipeIngredient.objects.bulk_create([
+        RecipeIngredient(recipe=recipe, amount=amount,
+                         ingredient=Ingredient.objects.create(
+                             name='Сахар', measurement_unit=unit))
+        for unit, amount in (('кг', 1), ('г', 200))
+    ])
+    user_client.post(f'/api/recipes/{recipe.id}/shopping_cart/',
+                     {'servings': 2})
+    assert list(shopping_cart_rows(user)) == [
+        ('Молоко', 'мл', 4), ('Мука', 'г', 2), ('Сахар', 'г', 2400),
+        ('Яйца', 'шт.', 6)]
+    assert_consistent()
@@ -8,7 +8,8 @@ class UserAdmin(admin.ModelAdmin):
     """Для модели User создана кастомная админка."""
     list_display = ('username', 'id',
                     'email', 'first_name',
-                    'last_name')
+                    'last_name', 'recipes_count',
+                    'followers_count')
     list_filter = ('username', 'email')
 
 
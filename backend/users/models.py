@@ -15,6 +15,16 @@ class User(AbstractUser):
         max_length=254,
         unique=True,
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         ordering = ['id']
@@ -46,3 +56,6 @@ class Subscription(models.Model):
         constraints = [models.UniqueConstraint(
             fields=['user', 'author'],
             name='unique_following')]
+        indexes = [models.Index(
+            fields=['author', 'user'],
+            name='subscription_author_user_idx')]